@@ -0,0 +1,85 @@
+"""Login throughput and tail latency of other endpoints under concurrent logins.
+
+Run against a live server, e.g. ``uvicorn main:app`` with a migrated database:
+
+    python -m benchmarks.login --url http://localhost:8000 --concurrency 32 --duration 10
+
+Compare runs with different ``PASSWORD_HASH_WORKERS`` / ``PASSWORD_HASH_EXECUTOR``
+settings on the server.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def request(url: str, method: str = "GET", body: dict | None = None, token: str | None = None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read())
+
+
+def percentiles(samples: list[float]) -> str:
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return (
+        f"n={len(samples)} mean={statistics.mean(samples) * 1000:.1f}ms "
+        f"p50={pick(0.5):.1f}ms p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms "
+        f"max={samples[-1] * 1000:.1f}ms"
+    )
+
+
+async def timed(loop, executor, samples: list[float], *args, **kwargs) -> None:
+    start = time.perf_counter()
+    await loop.run_in_executor(executor, lambda: request(*args, **kwargs))
+    samples.append(time.perf_counter() - start)
+
+
+async def run(url: str, concurrency: int, duration: float) -> None:
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency + 1)
+    credentials = {"username": f"bench_{uuid.uuid4()}", "password": "password"}
+    token = request(f"{url}/auth/register", "POST", credentials)["access_token"]
+    await idle_baseline(loop, executor, url, token)
+    deadline = time.perf_counter() + duration
+    logins: list[float] = []
+    probes: list[float] = []
+
+    async def login_loop():
+        while time.perf_counter() < deadline:
+            await timed(loop, executor, logins, f"{url}/auth/token", "POST", credentials)
+
+    async def probe_loop():
+        while time.perf_counter() < deadline:
+            await timed(loop, executor, probes, f"{url}/files/", token=token)
+
+    await asyncio.gather(probe_loop(), *(login_loop() for _ in range(concurrency)))
+    executor.shutdown()
+    print(f"logins: {len(logins) / duration:.1f}/s {percentiles(logins)}")
+    print(f"GET /files/ under load: {percentiles(probes)}")
+
+
+async def idle_baseline(loop, executor, url: str, token: str, count: int = 50) -> None:
+    probes: list[float] = []
+    for _ in range(count):
+        await timed(loop, executor, probes, f"{url}/files/", token=token)
+    print(f"GET /files/ idle: {percentiles(probes)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.url.rstrip("/"), args.concurrency, args.duration))
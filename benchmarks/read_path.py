@@ -0,0 +1,88 @@
+"""CPU time and memory of building the GET /files/{file_id} response.
+
+Compares the ORM path (cells of Data entities pivoted with a defaultdict and encoded by
+FastAPI's jsonable_encoder and the stdlib json module) with the Core tuple path
+(DatabaseService.get_column_values encoded by serialize, which uses orjson when
+installed). Needs the DB_* environment variables of a migrated database:
+
+    python -m benchmarks.read_path --rows 100000 --columns 8
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+
+from fastapi.encoders import jsonable_encoder
+
+from src.cache import serialize
+from src.database import DatabaseService, async_session
+
+
+async def orm_path(service: DatabaseService, file_id: uuid.UUID) -> bytes:
+    data = defaultdict(list)
+    for item in await service.get_data(file_id):
+        data[item.column_name].append(item.value)
+    return json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+
+
+async def core_path(service: DatabaseService, file_id: uuid.UUID) -> bytes:
+    return serialize(await service.get_column_values(file_id))
+
+
+async def measure(name: str, path, file_id: uuid.UUID, repeat: int) -> None:
+    timings = []
+    for _ in range(repeat):
+        async with async_session() as session:
+            service = DatabaseService(session)
+            tracemalloc.start()
+            wall, cpu = time.perf_counter(), time.process_time()
+            body = await path(service, file_id)
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        timings.append((wall, cpu, peak))
+    wall, cpu, peak = min(timings)
+    print(
+        f"{name}: wall={wall * 1000:.0f}ms cpu={cpu * 1000:.0f}ms "
+        f"peak_memory={peak / 2**20:.1f}MiB body={len(body) / 2**20:.1f}MiB"
+    )
+
+
+async def run(rows: int, columns: int, repeat: int) -> None:
+    column_names = [f"column_{i}" for i in range(columns)]
+    async with async_session() as session:
+        service = DatabaseService(session)
+        user = await service.create_user(f"bench_{uuid.uuid4()}", "password")
+        await service.commit()
+        file = await service.create_file("bench.csv", user.id, column_names)
+        await service.commit()
+        batches = (
+            [[f"value {row} {column}" for column in range(columns)]
+             for row in range(start, min(start + 10000, rows))]
+            for start in range(0, rows, 10000)
+        )
+        await service.ingest_batches(file.id, column_names, batches)
+        await service.commit()
+    try:
+        await measure("orm", orm_path, file.id, repeat)
+        await measure("core", core_path, file.id, repeat)
+    finally:
+        async with async_session() as session:
+            service = DatabaseService(session)
+            await service.delete_file(file.id)
+            while await service.purge_file(file.id):
+                await service.commit()
+            await service.delete_user(user.id)
+            await service.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.columns, args.repeat))
@@ -1,7 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from src.routers import auth, files
+from src.auth.password import shutdown_password_executor
+from src.database.reclaim import file_reclaimer
+from src.ingest import INGEST_RECOVER, ingest_queue
+from src.routers import auth, files, metrics
+from src.routers.utils import DefaultJSONResponse
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INGEST_RECOVER:
+        await ingest_queue.recover()
+    await ingest_queue.start()
+    await file_reclaimer.start()
+    yield
+    await ingest_queue.stop()
+    await file_reclaimer.stop()
+    shutdown_password_executor()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultJSONResponse)
 
 app.include_router(auth.router)
 app.include_router(files.router)
+app.include_router(metrics.router)
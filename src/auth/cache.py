@@ -0,0 +1,17 @@
+import hashlib
+import os
+
+from ..cache import CacheBackend, LocalCache
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+
+auth_cache: CacheBackend = LocalCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+
+def token_key(token: str) -> str:
+    return "token:" + hashlib.sha256(token.encode()).hexdigest()
+
+
+def user_key(username: str) -> str:
+    return f"user:{username}"
@@ -1,10 +1,61 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
+from ..errors import UnknownPasswordExecutor
+
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_EXECUTORS = ("thread", "process")
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_HASH_ROUNDS
+)
+
+_executor: Executor | None = None
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+
+def get_password_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR not in PASSWORD_HASH_EXECUTORS:
+            raise UnknownPasswordExecutor(PASSWORD_HASH_EXECUTOR)
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password"
+            )
+    return _executor
+
+
+def shutdown_password_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(), verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(), get_password_hash, password
+    )
@@ -0,0 +1,8 @@
+from .backends import CacheBackend, LocalCache
+from .materialized import (
+    Materialized,
+    etag_matches,
+    materialized_cache,
+    materialized_key,
+    serialize,
+)
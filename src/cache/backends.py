@@ -0,0 +1,76 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: Hashable) -> Any | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: Hashable) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+
+class LocalCache(CacheBackend):
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float | None = None,
+        maxbytes: int | None = None,
+        sizeof: Callable[[Any], int] = len,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.items: OrderedDict[Hashable, tuple[float | None, Any]] = OrderedDict()
+
+    async def get(self, key: Hashable) -> Any | None:
+        item = self.items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self.items.move_to_end(key)
+        return value
+
+    async def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        if self.maxbytes is not None:
+            self._remove(key)
+            if self.sizeof(value) > self.maxbytes:
+                return
+            self.nbytes += self.sizeof(value)
+        self.items[key] = (expires_at, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize or (
+            self.maxbytes is not None and self.nbytes > self.maxbytes
+        ):
+            self._remove(next(iter(self.items)))
+
+    async def delete(self, key: Hashable) -> None:
+        self._remove(key)
+
+    async def clear(self) -> None:
+        self.items.clear()
+        self.nbytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        item = self.items.pop(key, None)
+        if item is not None and self.maxbytes is not None:
+            self.nbytes -= self.sizeof(item[1])
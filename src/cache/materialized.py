@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Hashable
+from uuid import UUID
+
+from .backends import CacheBackend, LocalCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MATERIALIZE_CACHE_SIZE = int(os.getenv("MATERIALIZE_CACHE_SIZE", 1024))
+MATERIALIZE_CACHE_BYTES = int(os.getenv("MATERIALIZE_CACHE_BYTES", 64 * 1024 * 1024))
+MATERIALIZE_COMPRESS_LEVEL = int(os.getenv("MATERIALIZE_COMPRESS_LEVEL", 6))
+MATERIALIZE_COMPRESS_MIN_BYTES = 1024
+
+
+class Materialized:
+    def __init__(self, body: bytes, headers: dict[str, str] | None = None) -> None:
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.headers = headers or {}
+        self.compressed = (
+            MATERIALIZE_COMPRESS_LEVEL > 0 and len(body) >= MATERIALIZE_COMPRESS_MIN_BYTES
+        )
+        if self.compressed:
+            body = gzip.compress(body, compresslevel=MATERIALIZE_COMPRESS_LEVEL, mtime=0)
+        self.body = body
+
+    def __len__(self) -> int:
+        return len(self.body)
+
+    def content(self, accept_gzip: bool) -> tuple[bytes, dict[str, str]]:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding", **self.headers}
+        if not self.compressed:
+            return self.body, headers
+        if accept_gzip:
+            return self.body, {**headers, "Content-Encoding": "gzip"}
+        return gzip.decompress(self.body), headers
+
+
+materialized_cache: CacheBackend = LocalCache(
+    maxsize=MATERIALIZE_CACHE_SIZE, maxbytes=MATERIALIZE_CACHE_BYTES
+)
+
+
+def serialize(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def materialized_key(file_id: UUID, version: int, signature: Hashable) -> Hashable:
+    # The version is stored with the file, so a change committed by any server
+    # process makes older entries unreachable; they age out of the LRU.
+    return ("file", file_id, version, signature)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
@@ -1 +1,2 @@
-from .processor import CSVProcessor
+from .processor import COLUMN_TYPES, NUMERIC_TYPES, CSVProcessor, convert_value, infer_type
+from .parallel import PARSE_CHUNK_BYTES, parallel_batches, parse_chunk, record_chunks, record_end, splittable
@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import csv
+import io
+import mmap
+import os
+import re
+from concurrent.futures import Executor
+from typing import AsyncIterator, Iterator
+
+
+PARSE_CHUNK_BYTES = int(os.getenv("PARSE_CHUNK_BYTES", 8 * 1024 * 1024))
+DIALECT_PARAMS = ("delimiter", "quotechar", "doublequote", "escapechar", "skipinitialspace", "quoting")
+
+
+def dialect_params(dialect) -> dict:
+    # Sniffed dialects are local classes, which cannot be pickled for the workers.
+    return {name: getattr(dialect, name) for name in DIALECT_PARAMS}
+
+
+def splittable(dialect) -> bool:
+    # Without doubled quotes or with an escape character, quotes cannot be
+    # told apart from the bytes around them; such files are parsed in one go.
+    params = dialect_params(dialect)
+    if params["escapechar"]:
+        return False
+    return params["quoting"] == csv.QUOTE_NONE or params["doublequote"]
+
+
+def _record_patterns(
+    quotechar: str, delimiter: str, skipinitialspace: bool
+) -> tuple[re.Pattern, re.Pattern]:
+    """Patterns over the text outside of quoted fields, read as the csv module reads it.
+
+    A quote only opens a field at the start of a field; elsewhere it is a
+    plain character. A quoted field ends at its first quote that is not
+    doubled. The first pattern stops where a quoted field opens that does not
+    close before endpos, the second matches up to the next newline outside of
+    quotes.
+    """
+    quote = re.escape(quotechar.encode())
+    boundaries = re.escape(delimiter.encode()) + rb"\r\n"
+    spaces = rb" *" if skipinitialspace else b""
+
+    def field(group: int, newline: bool) -> bytes:
+        excluded = quote + (rb"\n" if newline else b"") + (b" " if skipinitialspace else b"")
+        text = b"[^" + excluded + b"]+"
+        if skipinitialspace:
+            text += b"| (?! *" + quote + b")"
+        # A lookahead with a backreference matches like an atomic group, so a
+        # quoted field is never cut short at a doubled quote by backtracking.
+        quoted = (
+            b"(?<![^" + boundaries + b"])" + spaces + quote
+            + b"(?=((?:[^" + quote + b"]+|" + quote + quote + b")*))\\" + str(group).encode()
+            + quote
+        )
+        plain = b"(?<=[^" + boundaries + b"])" + spaces + quote
+        return b"(?:" + quoted + b"|" + plain + b"|" + text + b")"
+
+    outside = re.compile(field(1, False) + b"*")
+    record_end = re.compile(b"(?=(" + field(2, True) + rb"*))\1\n")
+    return outside, record_end
+
+
+def _record_end(
+    data, start: int, chunk_bytes: int, quotechar: str | None, delimiter: str, skipinitialspace: bool
+) -> int:
+    target = start + chunk_bytes
+    if not quotechar:
+        newline = data.find(b"\n", target)
+        return len(data) if newline < 0 else newline + 1
+    # The patterns look ahead past quotes and skipped spaces, so the scan never
+    # stops right after one, where the lookahead would be cut short.
+    held = (quotechar.encode(), b" ") if skipinitialspace else (quotechar.encode(),)
+    while target > start and data[target - 1:target] in held:
+        target -= 1
+    outside, record_end = _record_patterns(quotechar, delimiter, skipinitialspace)
+    end = outside.match(data, start, target).end()
+    match = record_end.match(data, end)
+    return len(data) if match is None else match.end()
+
+
+def record_end(
+    path: str,
+    start: int,
+    chunk_bytes: int = PARSE_CHUNK_BYTES,
+    quotechar: str | None = '"',
+    delimiter: str = ",",
+    skipinitialspace: bool = False,
+) -> int:
+    """Returns the end of the first record ending chunk_bytes or more after start.
+
+    start must be the start of a record. A newline only ends a record outside
+    of quoted fields; a quote inside an unquoted field is a plain character,
+    as for the csv module. Returns the file size if no record ends that late.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if start + chunk_bytes >= size:
+            return size
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _record_end(data, start, chunk_bytes, quotechar, delimiter, skipinitialspace)
+
+
+def record_chunks(
+    path: str,
+    chunk_bytes: int = PARSE_CHUNK_BYTES,
+    quotechar: str | None = '"',
+    delimiter: str = ",",
+    skipinitialspace: bool = False,
+) -> Iterator[tuple[int, int]]:
+    """Yields (start, end) byte ranges of about chunk_bytes that end on a record boundary."""
+    size = os.path.getsize(path)
+    start = 0
+    while start < size:
+        end = record_end(path, start, chunk_bytes, quotechar, delimiter, skipinitialspace)
+        yield start, end
+        start = end
+
+
+def parse_chunk(
+    path: str, start: int, end: int, dialect: dict, width: int, skip_header: bool = False
+) -> list[list[str]]:
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    # Chunks end after a newline byte, which never splits a UTF-8 sequence.
+    reader = csv.reader(io.StringIO(data.decode("utf-8"), newline=""), **dialect)
+    if skip_header:
+        next(reader, None)
+    return [
+        row + [""] * (width - len(row)) if len(row) < width else row[:width]
+        for row in reader
+        if row
+    ]
+
+
+async def parallel_batches(
+    path: str,
+    dialect,
+    width: int,
+    executor: Executor,
+    batch_size: int,
+    chunk_bytes: int = PARSE_CHUNK_BYTES,
+    window: int = 2,
+) -> AsyncIterator[tuple[list[list[str]], int]]:
+    """Parses the chunks of path in executor and yields (batch, bytes parsed) in file order.
+
+    At most window chunks are parsed ahead of the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    params = dialect_params(dialect)
+    quotechar = None if params["quoting"] == csv.QUOTE_NONE else params["quotechar"]
+    size = os.path.getsize(path)
+    start = 0
+    pending = collections.deque()
+    try:
+        while True:
+            while len(pending) < window and start < size:
+                # Split points are found in the executor too, as scanning a
+                # chunk for them holds the GIL.
+                end = await loop.run_in_executor(
+                    executor,
+                    record_end,
+                    path,
+                    start,
+                    chunk_bytes,
+                    quotechar,
+                    params["delimiter"],
+                    params["skipinitialspace"],
+                )
+                future = loop.run_in_executor(
+                    executor, parse_chunk, path, start, end, params, width, start == 0
+                )
+                pending.append((future, end))
+                start = end
+            if not pending:
+                return
+            future, end = pending.popleft()
+            rows = await future
+            for offset in range(0, len(rows), batch_size):
+                yield rows[offset:offset + batch_size], end
+    finally:
+        for future, _ in pending:
+            future.cancel()
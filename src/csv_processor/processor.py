@@ -1,16 +1,94 @@
 import codecs
 import csv
-from typing import IO
+import itertools
+import os
+import re
+from datetime import date
+from typing import IO, Iterable, Iterator
 from ..errors import CSVValidationError
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+
+INFER_SAMPLE_ROWS = int(os.getenv("INFER_SAMPLE_ROWS", 1000))
+PARSE_BATCH_SIZE = int(os.getenv("PARSE_BATCH_SIZE", 10000))
+CSV_ENGINES = ("auto", "pyarrow", "python")
+CSV_ENGINE = os.getenv("CSV_ENGINE", "auto")
+COLUMN_TYPES = ("int", "float", "bool", "date", "text")
+NUMERIC_TYPES = ("int", "float", "bool")
+INT_PATTERN = re.compile(r"\s*[-+]?\d+\s*")
+FLOAT_PATTERN = re.compile(r"\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*")
+DATE_PATTERN = re.compile(r"\s*\d{4}-\d{2}-\d{2}\s*")
+BOOL_VALUES = {"true": 1.0, "yes": 1.0, "false": 0.0, "no": 0.0}
+
+
+def convert_value(value: str, column_type: str) -> float | date | None:
+    if column_type == "int" and INT_PATTERN.fullmatch(value):
+        return float(value)
+    if column_type == "float" and FLOAT_PATTERN.fullmatch(value):
+        return float(value)
+    if column_type == "bool":
+        return BOOL_VALUES.get(value.strip().lower())
+    if column_type == "date" and DATE_PATTERN.fullmatch(value):
+        try:
+            return date.fromisoformat(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def infer_type(values: Iterable[str]) -> str:
+    candidates = COLUMN_TYPES[:-1]
+    seen_value = False
+    for value in values:
+        if not value:
+            continue
+        seen_value = True
+        candidates = [
+            column_type for column_type in candidates
+            if convert_value(value, column_type) is not None
+        ]
+        if not candidates:
+            return "text"
+    return candidates[0] if seen_value else "text"
+
 
 class CSVProcessor:
-    def __init__(self, file: IO) -> None:
+    def __init__(
+        self,
+        file: IO,
+        sample_rows: int = INFER_SAMPLE_ROWS,
+        batch_size: int | None = None,
+        engine: str | None = None,
+    ) -> None:
         self.file = file
         sample_string = file.read(5000)
         sample_string = sample_string.decode()
         file.seek(0)
-        self.reader = csv.DictReader(codecs.iterdecode(file, "utf-8"), dialect=self.get_dialect(sample_string))
+        self.dialect = self.get_dialect(sample_string)
+        self.batch_size = batch_size or PARSE_BATCH_SIZE
+        self.engine = self.get_engine(engine or CSV_ENGINE)
+        reader = csv.reader(codecs.iterdecode(file, "utf-8"), dialect=self.dialect)
+        self.column_names = next(reader, None)
+        # Only the sample is parsed here; batches are parsed as they are read.
+        rows = self.python_rows(reader)
+        sample_values = list(itertools.islice(rows, sample_rows))
+        self.column_types = {
+            column_name: infer_type(row[position] for row in sample_values)
+            for position, column_name in enumerate(self.column_names or [])
+        }
+        if self.engine == "pyarrow" and self.column_names:
+            self.batches = self.arrow_batches()
+        else:
+            self.batches = self.python_batches(itertools.chain(sample_values, rows))
+        self.rows = (
+            dict(zip(self.column_names, row))
+            for row in itertools.chain.from_iterable(self.batches)
+        )
 
     def get_dialect(self, sample_string):
         try:
@@ -20,13 +98,71 @@ class CSVProcessor:
                 raise CSVValidationError
         return dialect
 
-    @property
-    def column_names(self):
-        return self.reader.fieldnames
-    
+    def get_engine(self, engine: str) -> str:
+        if engine not in CSV_ENGINES:
+            raise ValueError(f"Unknown CSV engine {engine}")
+        if engine == "auto":
+            return "pyarrow" if pa_csv is not None else "python"
+        if engine == "pyarrow" and pa_csv is None:
+            raise ImportError("pyarrow is required for the pyarrow CSV engine")
+        return engine
+
+    def python_batches(self, rows: Iterator[list[str]]) -> Iterator[list[list[str]]]:
+        return iter(lambda: list(itertools.islice(rows, self.batch_size)), [])
+
+    def python_rows(self, reader: Iterator[list[str]]) -> Iterator[list[str]]:
+        width = len(self.column_names or [])
+        return (
+            row + [""] * (width - len(row)) if len(row) < width else row[:width]
+            for row in reader
+            if row
+        )
+
+    def arrow_batches(self) -> Iterator[list[list[str]]]:
+        self.file.seek(0)
+        parsed = 0
+        pending = []
+        try:
+            reader = pa_csv.open_csv(
+                self.file,
+                read_options=pa_csv.ReadOptions(column_names=self.column_names, skip_rows=1),
+                parse_options=pa_csv.ParseOptions(
+                    delimiter=self.dialect.delimiter,
+                    quote_char=self.dialect.quotechar or False,
+                    double_quote=self.dialect.doublequote,
+                    escape_char=self.dialect.escapechar or False,
+                    newlines_in_values=True,
+                ),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=dict.fromkeys(self.column_names, pa.string())
+                ),
+            )
+            for record_batch in reader:
+                columns = [column.to_pylist() for column in record_batch.columns]
+                rows = [[value or "" for value in row] for row in zip(*columns)]
+                parsed += len(rows)
+                pending.extend(rows)
+                while len(pending) >= self.batch_size:
+                    yield pending[:self.batch_size]
+                    pending = pending[self.batch_size:]
+        except pa.ArrowInvalid:
+            # Arrow can only skip or reject rows with too few or too many
+            # values; the csv module pads or truncates them like python_batches.
+            self.file.seek(0)
+            reader = csv.reader(codecs.iterdecode(self.file, "utf-8"), dialect=self.dialect)
+            next(reader, None)
+            rows = itertools.islice(self.python_rows(reader), parsed, None)
+            while rows_batch := list(itertools.islice(rows, self.batch_size - len(pending))):
+                pending.extend(rows_batch)
+                if len(pending) >= self.batch_size:
+                    yield pending
+                    pending = []
+        if pending:
+            yield pending
+
     def __iter__(self):
         return self
     
     def __next__(self):
-        row = next(self.reader)
+        row = next(self.rows)
         return row
@@ -1,5 +1,6 @@
 from contextlib import asynccontextmanager
 from typing import AsyncIterator
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
@@ -15,17 +16,83 @@ if not (os.getenv('DB_USER') and os.getenv('DB_PASS') and os.getenv('DB_IP') and
 DATABASE_URL = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_IP')}/{os.getenv('DB_NAME')}"
 
 
-engine = create_async_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+pool_counters = {"connects": 0, "checkouts": 0, "invalidations": 0}
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _count_connect(dbapi_connection, connection_record):
+    pool_counters["connects"] += 1
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_counters["checkouts"] += 1
+
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def _count_invalidate(dbapi_connection, connection_record, exception):
+    pool_counters["invalidations"] += 1
+
+
+def pool_status() -> dict[str, int]:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        **pool_counters,
+    }
+
+
 async def reset_models():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
 
 
-# @asynccontextmanager
+def _create_indexes(conn):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    Base.metadata.create_all(conn)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def create_indexes():
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_indexes)
+
+
+# FastAPI caches dependencies per request, so every Depends(get_db_service) in
+# one request (auth, ACL and the handler) shares this session. The session checks
+# out a pooled connection on its first statement and returns it when the
+# transaction ends, so requests waiting on something else (password hashing,
+# cached auth) do not hold a connection.
 async def get_db_service() -> DatabaseService:
     async with async_session() as session:
         yield DatabaseService(session)
@@ -0,0 +1,24 @@
+from sqlalchemy import distinct, func
+
+AGGREGATE_FUNCTIONS = ("count", "sum", "min", "max", "avg", "distinct")
+NUMERIC_AGGREGATES = ("sum", "avg")
+
+
+def parse_aggregate(query: str) -> tuple[str, str | None]:
+    function, _, column_name = query.partition(":")
+    if function not in AGGREGATE_FUNCTIONS or (function != "count" and not column_name):
+        raise ValueError(f"Invalid aggregate {query}")
+    return function, column_name or None
+
+
+def aggregate_label(function: str, column_name: str | None) -> str:
+    return function if column_name is None else f"{function}_{column_name}"
+
+
+def aggregate_expression(function: str, value, typed_value=None):
+    value = func.nullif(value, "")
+    if function == "count":
+        return func.count(value)
+    if function == "distinct":
+        return func.count(distinct(value))
+    return getattr(func, function)(value if typed_value is None else typed_value)
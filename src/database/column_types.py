@@ -0,0 +1,106 @@
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import Date, Float, Integer, Numeric, and_, case, cast, func, literal, or_
+from ..csv_processor import NUMERIC_TYPES, convert_value
+
+# Patterns guarding a cast spell out ASCII digits and spaces, which are all the
+# casts accept, where \d and \s would follow the database locale. Numbers are
+# cast through numeric, which cannot overflow for values this short with an
+# exponent of at most three digits.
+NUMERIC_PATTERN = r"^[ \t\n\r\f\v]*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]{1,3})?[ \t\n\r\f\v]*$"
+NUMERIC_MAX_LENGTH = 1000
+FLOAT_MAX = Decimal("1.7976931348623157e308")
+FLOAT_MIN = Decimal("2.2250738585072014e-308")
+DATE_DIGITS = r"[0-9]{4}-[0-9]{2}-[0-9]{2}"
+DATE_PATTERN = rf"^\s*{DATE_DIGITS}\s*$"
+INT_PATTERN = r"^[ \t\n\r\f\v]*[-+]?[0-9]+[ \t\n\r\f\v]*$"
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+FLOAT_CONVERTIBLE_PATTERN = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+VALUE_KINDS = ("text", "numeric", "date")
+
+
+def value_kind(column_type: str | None) -> str:
+    if column_type in NUMERIC_TYPES:
+        return "numeric"
+    if column_type == "date":
+        return "date"
+    return "text"
+
+
+def typed_expression(expression, kind: str, column_type: str | None = None):
+    if kind == "numeric" and column_type == "bool":
+        lowered = func.lower(func.trim(expression))
+        return case(
+            (lowered.in_(("true", "yes")), literal(1.0, Float)),
+            (lowered.in_(("false", "no")), literal(0.0, Float)),
+        )
+    if kind == "numeric":
+        number = cast(expression, Numeric)
+        magnitude = func.abs(number)
+        # Out of range values become infinity or zero, as with float(), instead
+        # of failing the cast to double precision.
+        infinity = cast(literal("Infinity"), Float)
+        as_float = case(
+            (magnitude > literal(FLOAT_MAX, Numeric), func.sign(number) * infinity),
+            (magnitude < literal(FLOAT_MIN, Numeric), literal(0.0, Float)),
+            else_=cast(number, Float),
+        )
+        parses = and_(
+            expression.regexp_match(NUMERIC_PATTERN),
+            func.length(expression) <= NUMERIC_MAX_LENGTH,
+        )
+        return case((parses, as_float))
+    if kind == "date":
+        return case((expression.regexp_match(DATE_PATTERN), _valid_date(expression)))
+    return expression
+
+
+def _valid_date(expression):
+    """The date of a value matching DATE_PATTERN, or NULL if there is no such day."""
+    digits = func.substring(expression, DATE_DIGITS)
+    year = cast(func.substr(digits, 1, 4), Integer)
+    month = cast(func.substr(digits, 6, 2), Integer)
+    day = cast(func.substr(digits, 9, 2), Integer)
+    leap = or_(and_(year % 4 == 0, year % 100 != 0), year % 400 == 0)
+    days = case(
+        (month == 2, case((leap, 29), else_=28)),
+        (month.in_((4, 6, 9, 11)), 30),
+        else_=31,
+    )
+    valid = and_(year >= 1, month.between(1, 12), day.between(1, days))
+    return case((valid, func.make_date(year, month, day, type_=Date)))
+
+
+def convertible(expression, column_type: str):
+    """SQL test of whether value exports as column_type.
+
+    That is whether convert_value(value, column_type) gives a value, and for
+    ints whether it fits in an int64; it may reject some odd values that do.
+    """
+    if column_type == "int":
+        parses = and_(
+            expression.regexp_match(INT_PATTERN),
+            func.length(expression) <= NUMERIC_MAX_LENGTH,
+        )
+        in_range = cast(expression, Numeric).between(INT64_MIN, INT64_MAX)
+        return case((parses, in_range), else_=False)
+    if column_type == "float":
+        return expression.regexp_match(FLOAT_CONVERTIBLE_PATTERN)
+    return typed_expression(expression, value_kind(column_type), column_type).is_not(None)
+
+
+def convert_bound(value: str, kind: str) -> str | float | date | None:
+    if kind == "numeric":
+        return convert_value(value, "float")
+    if kind == "date":
+        return convert_value(value, "date")
+    return value
+
+
+def typed_values(value: str | None, column_type: str | None) -> tuple[float | None, date | None]:
+    typed_value = convert_value(value, column_type) if value else None
+    if value_kind(column_type) == "numeric":
+        return typed_value, None
+    if value_kind(column_type) == "date":
+        return None, typed_value
+    return None, None
@@ -0,0 +1,33 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement) -> None:
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element: Explain, compiler, **kw) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def summarize_plan(plan: dict, relations: tuple[str, ...]) -> dict:
+    seq_scans = []
+    indexes = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            indexes.append(node["Index Name"])
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in relations:
+            seq_scans.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return {
+        "uses_index": bool(indexes) and not seq_scans,
+        "indexes": indexes,
+        "seq_scans": seq_scans,
+        "plan": plan,
+    }
@@ -0,0 +1,46 @@
+import operator
+from sqlalchemy import and_, false, true
+from .column_types import convert_bound
+
+FILTER_MODES = {"=": "exact", "^": "prefix", "~": "contains"}
+RANGE_MODES = {">=": "ge", "<=": "le", ">": "gt", "<": "lt"}
+RANGE_OPERATORS = {"ge": operator.ge, "le": operator.le, "gt": operator.gt, "lt": operator.lt}
+
+
+def parse_filter(query: str) -> tuple[str, str]:
+    if query[:1] in FILTER_MODES:
+        return FILTER_MODES[query[0]], query[1:]
+    for prefix, mode in RANGE_MODES.items():
+        if query.startswith(prefix):
+            return mode, query[len(prefix):]
+    if ".." in query:
+        return "between", query
+    return "contains", query
+
+
+def filter_condition(expression, query: str, typed_expression=None, kind: str = "text"):
+    mode, value = parse_filter(query)
+    if mode == "exact":
+        return expression == value
+    if mode == "prefix":
+        return expression.istartswith(value, autoescape=True)
+    if mode == "contains":
+        return expression.icontains(value, autoescape=True)
+    if typed_expression is None:
+        typed_expression, kind = expression, "text"
+    if mode == "between":
+        low, _, high = value.partition("..")
+        conditions = []
+        if low:
+            conditions.append(range_condition(typed_expression, "ge", low, kind))
+        if high:
+            conditions.append(range_condition(typed_expression, "le", high, kind))
+        return and_(*conditions) if conditions else true()
+    return range_condition(typed_expression, mode, value, kind)
+
+
+def range_condition(expression, mode: str, value: str, kind: str):
+    bound = convert_bound(value, kind)
+    if bound is None:
+        return false()
+    return RANGE_OPERATORS[mode](expression, bound)
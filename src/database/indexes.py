@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import json
+from uuid import UUID
+
+from sqlalchemy import select
+
+from . import async_session, create_indexes
+from .models import File
+from .service import DatabaseService
+
+
+async def check_file(file_id: UUID, filters: dict[str, str], verbose: bool = False) -> None:
+    async with async_session() as session:
+        service = DatabaseService(session)
+        report = await service.explain_data(file_id, filters)
+    if verbose:
+        print(json.dumps(report["plan"], indent=2))
+    print(f"indexes used: {', '.join(report['indexes']) or 'none'}")
+    print(f"sequential scans: {', '.join(report['seq_scans']) or 'none'}")
+    print("OK" if report["uses_index"] else "WARNING: filtered read does not use an index")
+
+
+async def index_search(file_ids: list[UUID]) -> None:
+    async with async_session() as session:
+        service = DatabaseService(session)
+        if not file_ids:
+            file_ids = list((await session.execute(select(File.id))).scalars())
+        for file_id in file_ids:
+            rows = await service.index_search_documents(file_id)
+            await service.commit()
+            print(f"{file_id}: {rows} rows indexed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage and check indexes used by file reads")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("create", help="create missing extensions, tables and indexes")
+    search_parser = subparsers.add_parser("search", help="rebuild the search index of files")
+    search_parser.add_argument("file_ids", type=UUID, nargs="*", help="all files if omitted")
+    check_parser = subparsers.add_parser("check", help="EXPLAIN a filtered read of a file")
+    check_parser.add_argument("file_id", type=UUID)
+    check_parser.add_argument("filters", nargs="*", metavar="column=value")
+    check_parser.add_argument("-v", "--verbose", action="store_true", help="print the full plan")
+    args = parser.parse_args()
+    if args.command == "create":
+        asyncio.run(create_indexes())
+    elif args.command == "search":
+        asyncio.run(index_search(args.file_ids))
+    else:
+        filters = dict(item.split("=", 1) for item in args.filters)
+        asyncio.run(check_file(args.file_id, filters, args.verbose))
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+from sqlalchemy import select
+
+from . import async_session
+from .models import File
+from .service import STORAGE_LAYOUTS, DatabaseService
+
+
+async def migrate_files(layout: str) -> None:
+    async with async_session() as session:
+        result = await session.execute(select(File.id))
+        file_ids = list(result.scalars().all())
+    for file_id in file_ids:
+        async with async_session() as session:
+            service = DatabaseService(session, layout=layout)
+            rows = await service.convert_file_layout(file_id, layout)
+            await service.commit()
+        print(f"{file_id}: {rows} rows converted to {layout} layout")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored files between storage layouts")
+    parser.add_argument("layout", choices=STORAGE_LAYOUTS)
+    args = parser.parse_args()
+    asyncio.run(migrate_files(args.layout))
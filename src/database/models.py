@@ -1,10 +1,26 @@
 import uuid
-from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Column,
+    Computed,
+    Date,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    String,
+    ForeignKey,
+    event,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, UUID
 from sqlalchemy.orm import declarative_base
+from .partitions import DATA_PARTITIONS, partition_by_hash
 
 Base = declarative_base()
 
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 
 class User(Base):
     __tablename__ = "users"
@@ -24,22 +40,110 @@ class File(Base):
     name = Column(String, nullable=False)
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
     column_order = Column(String, nullable=False)
+    column_types = Column(String)
+    status = Column(String, nullable=False, default="ready", server_default="ready")
+    # Bumped on every committed change to the file's data; part of the read cache key.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # An ingest job runs in one server process, which renews its lease on the
+    # file with a heartbeat and records the job's progress here.
+    ingest_owner = Column(String)
+    ingest_heartbeat = Column(DateTime(timezone=True))
+    rows_ingested = Column(BigInteger, nullable=False, default=0, server_default="0")
+    bytes_processed = Column(BigInteger, nullable=False, default=0, server_default="0")
+    total_bytes = Column(BigInteger)
+    ingest_error = Column(String)
+
+    __table_args__ = (Index("ix_files_owner_id", "owner_id"),)
+
+    def __repr__(self) -> str:
+        return f"File(id={self.id}, name={self.name}, owner_id={self.owner_id}, column_order={self.column_order}, column_types={self.column_types}, status={self.status}, version={self.version})"
+
+
+class FileColumn(Base):
+    __tablename__ = "columns"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"), nullable=False)
+    position = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    type = Column(String, nullable=False, default="text", server_default="text")
+
+    __table_args__ = (Index("ix_columns_file_id_position", "file_id", "position", unique=True),)
 
     def __repr__(self) -> str:
-        return f"File(id={self.id}, name={self.name}, owner_id={self.owner_id}, column_order={self.column_order})"
+        return f"FileColumn(id={self.id}, file_id={self.file_id}, position={self.position}, name={self.name}, type={self.type})"
 
 
 class Data(Base):
     __tablename__ = "data"
 
-    id = Column(Integer, primary_key=True)
-    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"))
-    column_name = Column(String, nullable=False)
+    # file_id is part of the key so that the table can be partitioned on it.
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"), primary_key=True)
+    column_id = Column(Integer, ForeignKey("columns.id"), nullable=False)
     row_number = Column(Integer, nullable=False)
     value = Column(String, nullable=False, default="")
+    number_value = Column(Float)
+    date_value = Column(Date)
+
+    __table_args__ = (
+        Index("ix_data_file_id_column_id_row_number", "file_id", "column_id", "row_number"),
+        Index("ix_data_file_id_row_number", "file_id", "row_number"),
+        Index("ix_data_file_id_column_id_number_value", "file_id", "column_id", "number_value"),
+        Index("ix_data_file_id_column_id_date_value", "file_id", "column_id", "date_value"),
+        Index(
+            "ix_data_value_trgm",
+            "value",
+            postgresql_using="gin",
+            postgresql_ops={"value": "gin_trgm_ops"},
+        ),
+    )
 
     def __repr__(self) -> str:
-        return f"Data(id={self.id}, file_id={self.file_id}, column_name={self.column_name}, row_number={self.row_number}, value={self.value})"
+        return f"Data(id={self.id}, file_id={self.file_id}, column_id={self.column_id}, row_number={self.row_number}, value={self.value}, number_value={self.number_value}, date_value={self.date_value})"
+
+
+partition_by_hash(Data.__table__, "file_id", DATA_PARTITIONS)
+
+
+class Record(Base):
+    __tablename__ = "records"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"), nullable=False)
+    row_number = Column(Integer, nullable=False)
+    cells = Column(ARRAY(String), nullable=False)
+
+    __table_args__ = (
+        Index("ix_records_file_id_row_number", "file_id", "row_number", unique=True),
+    )
+
+    def __repr__(self) -> str:
+        return f"Record(id={self.id}, file_id={self.file_id}, row_number={self.row_number}, cells={self.cells})"
+
+
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"), nullable=False)
+    row_number = Column(Integer, nullable=False)
+    document = Column(String, nullable=False)
+    vector = Column(TSVECTOR, Computed("to_tsvector('simple', document)", persisted=True))
+
+    __table_args__ = (
+        Index("ix_search_documents_file_id_row_number", "file_id", "row_number"),
+        Index("ix_search_documents_vector", "vector", postgresql_using="gin"),
+        Index(
+            "ix_search_documents_document_trgm",
+            "document",
+            postgresql_using="gin",
+            postgresql_ops={"document": "gin_trgm_ops"},
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return f"SearchDocument(id={self.id}, file_id={self.file_id}, row_number={self.row_number}, document={self.document})"
 
 
 class FileAccess(Base):
@@ -49,6 +153,11 @@ class FileAccess(Base):
     file_id = Column(UUID(as_uuid=True), ForeignKey("files.id"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
 
+    __table_args__ = (
+        Index("ix_file_access_file_id_user_id", "file_id", "user_id"),
+        Index("ix_file_access_user_id", "user_id"),
+    )
+
     def __repr__(self) -> str:
         return (
             f"FileAccess(id={self.id}, file_id={self.file_id}, user_id={self.user_id})"
@@ -0,0 +1,29 @@
+import os
+from sqlalchemy import DDL, Table, event
+
+# 0 keeps the cell table unpartitioned.
+DATA_PARTITIONS = int(os.getenv("DATA_PARTITIONS", 0))
+
+
+def partition_names(table_name: str, partitions: int) -> list[str]:
+    return [f"{table_name}_p{remainder}" for remainder in range(partitions)]
+
+
+def partition_by_hash(table: Table, column_name: str, partitions: int) -> None:
+    """Creates table as hash-partitioned on column_name, with its partitions.
+
+    Postgres prunes the partitions of a query that compares column_name to a
+    constant or bound parameter, so every query on table should do so.
+    """
+    if partitions <= 0:
+        return
+    table.dialect_kwargs["postgresql_partition_by"] = f"HASH ({column_name})"
+    for remainder, name in enumerate(partition_names(table.name, partitions)):
+        event.listen(
+            table,
+            "after_create",
+            DDL(
+                f"CREATE TABLE {name} PARTITION OF {table.name} "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+            ),
+        )
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+
+from . import async_session
+from .service import DatabaseService
+
+RECLAIM_INTERVAL = float(os.getenv("RECLAIM_INTERVAL", 30))
+RECLAIM_PAUSE = float(os.getenv("RECLAIM_PAUSE", 0.1))
+
+logger = logging.getLogger(__name__)
+
+
+class FileReclaimer:
+    """Deletes the rows of soft-deleted files in small transactions."""
+
+    def __init__(self, interval: float = RECLAIM_INTERVAL, pause: float = RECLAIM_PAUSE) -> None:
+        self.interval = interval
+        self.pause = pause
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.worker())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def worker(self):
+        while True:
+            try:
+                await self.reclaim()
+            except Exception:
+                logger.exception("Reclaiming deleted files failed")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def reclaim(self) -> int:
+        reclaimed = 0
+        async with async_session() as session:
+            service = DatabaseService(session)
+            for file_id in await service.get_deleted_files():
+                try:
+                    while deleted := await service.purge_file(file_id):
+                        await service.commit()
+                        reclaimed += deleted
+                        await asyncio.sleep(self.pause)
+                    await service.commit()
+                except Exception:
+                    # e.g. an ingest job still writing rows of the file; retried next round
+                    await service.rollback()
+                    logger.exception("Reclaiming file %s failed", file_id)
+        return reclaimed
+
+
+file_reclaimer = FileReclaimer()
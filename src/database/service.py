@@ -1,12 +1,67 @@
-from uuid import UUID
-from sqlalchemy import and_, delete, exists, func, or_, select
+import itertools
+import json
+import os
+from datetime import timedelta
+from typing import AsyncIterator, Iterable, NamedTuple
+from uuid import UUID, uuid4
+from sqlalchemy import (
+    Integer,
+    Select,
+    and_,
+    any_,
+    bindparam,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, array
 from sqlalchemy.ext.asyncio import AsyncSession
-from .models import FileAccess, User, File, Data
+from sqlalchemy.orm import aliased
+from .aggregates import NUMERIC_AGGREGATES, aggregate_expression, aggregate_label
+from .explain import Explain, summarize_plan
+from .filters import filter_condition
+from .column_types import convertible, typed_expression, typed_values, value_kind
+from .sorting import keyset_condition, order_by, parse_sort
+from .partitions import DATA_PARTITIONS, partition_names
+from .models import FileAccess, FileColumn, Record, SearchDocument, User, File, Data
+from ..auth.cache import auth_cache, user_key
+from ..errors import UnknownStorageLayout
+
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 1000))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 1000))
+RECLAIM_BATCH_SIZE = int(os.getenv("RECLAIM_BATCH_SIZE", 5000))
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "true").lower() in ("1", "true", "yes")
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 50))
+STORAGE_LAYOUTS = ("cell", "row")
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "cell")
+
+
+class Cell(NamedTuple):
+    file_id: UUID
+    row_number: int
+    column_name: str
+    value: str
+
+
+def search_document(row: list[str]) -> str:
+    return "\n".join(value for value in row if value)
 
 
 class DatabaseService:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, layout: str | None = None):
         self.session = session
+        self.layout = layout or STORAGE_LAYOUT
+        self.changed_files: set[UUID] = set()
+        # Column name -> id of each file whose columns were loaded by this service.
+        self.column_ids: dict[UUID, dict[str, int]] = {}
+        if self.layout not in STORAGE_LAYOUTS:
+            raise UnknownStorageLayout(self.layout)
 
     async def create_user(self, username: str, hashed_password: str) -> User:
         db_user = User(username=username, hashed_password=hashed_password)
@@ -21,13 +76,43 @@ class DatabaseService:
     async def delete_user(self, user_id: UUID) -> bool:
         query_file_access = delete(FileAccess).where(FileAccess.user_id == user_id)
         await self.session.execute(query_file_access)
-        query_user = delete(User).where(User.id == user_id)
+        query_user = delete(User).where(User.id == user_id).returning(User.username)
         result = await self.session.execute(query_user)
-        return result.rowcount > 0
+        usernames = list(result.scalars().all())
+        for username in usernames:
+            await auth_cache.delete(user_key(username))
+        return len(usernames) > 0
 
-    async def create_file(self, name: str, owner_id: UUID, column_order: str) -> File:
-        db_file = File(name=name, owner_id=owner_id, column_order=column_order)
+    async def create_file(
+        self,
+        name: str,
+        owner_id: UUID,
+        column_order: list[str],
+        column_types: list[str] | None = None,
+        status: str = "ready",
+        ingest_owner: str | None = None,
+        total_bytes: int | None = None,
+    ) -> File:
+        db_file = File(
+            id=uuid4(),
+            name=name,
+            owner_id=owner_id,
+            column_order=",".join(column_order),
+            column_types=",".join(column_types) if column_types else None,
+            status=status,
+            ingest_owner=ingest_owner,
+            ingest_heartbeat=func.now() if ingest_owner else None,
+            total_bytes=total_bytes,
+        )
         self.session.add(db_file)
+        types = list(column_types or [])
+        types += ["text"] * (len(column_order) - len(types))
+        for position, (column_name, column_type) in enumerate(zip(column_order, types)):
+            self.session.add(
+                FileColumn(
+                    file_id=db_file.id, position=position, name=column_name, type=column_type
+                )
+            )
         return db_file
     
     async def get_file(self, file_id: UUID):
@@ -35,6 +120,160 @@ class DatabaseService:
         result = await self.session.execute(query)
         return result.scalar_one_or_none()
 
+    async def get_file_permission(
+        self, file_id: UUID, user_id: UUID
+    ) -> tuple[File | None, str | None]:
+        shared = (
+            select(FileAccess.id)
+            .where(FileAccess.file_id == File.id, FileAccess.user_id == user_id)
+            .exists()
+        )
+        permission = case((File.owner_id == user_id, "owner"), (shared, "read"))
+        query = select(File, permission).where(File.id == file_id, File.status != "deleted")
+        result = await self.session.execute(query)
+        row = result.one_or_none()
+        if row is None:
+            return None, None
+        return row[0], row[1]
+
+    async def set_file_status(self, file_id: UUID, status: str) -> bool:
+        query = (
+            update(File)
+            .where(File.id == file_id, File.status != "deleted")
+            .values(status=status)
+        )
+        result = await self.session.execute(query)
+        return result.rowcount > 0
+
+    async def renew_ingest_lease(
+        self, file_id: UUID, owner: str, rows_ingested: int, bytes_processed: int
+    ) -> bool:
+        query = (
+            update(File)
+            .where(File.id == file_id, File.status == "processing", File.ingest_owner == owner)
+            .values(
+                ingest_heartbeat=func.now(),
+                rows_ingested=rows_ingested,
+                bytes_processed=bytes_processed,
+            )
+        )
+        result = await self.session.execute(query)
+        return result.rowcount > 0
+
+    async def end_ingest(
+        self,
+        file_id: UUID,
+        owner: str,
+        status: str,
+        rows_ingested: int,
+        bytes_processed: int,
+        error: str | None = None,
+    ) -> bool:
+        # A job whose file was recovered or deleted meanwhile must not change it.
+        query = (
+            update(File)
+            .where(File.id == file_id, File.status == "processing", File.ingest_owner == owner)
+            .values(
+                status=status,
+                rows_ingested=rows_ingested,
+                bytes_processed=bytes_processed,
+                ingest_error=error,
+            )
+        )
+        result = await self.session.execute(query)
+        return result.rowcount > 0
+
+    async def fail_expired_ingests(self, lease_timeout: float) -> list[UUID]:
+        expired = or_(
+            File.ingest_heartbeat.is_(None),
+            File.ingest_heartbeat < func.now() - timedelta(seconds=lease_timeout),
+        )
+        query = (
+            update(File)
+            .where(File.status == "processing", expired)
+            .values(status="failed", ingest_error="Ingest interrupted by a server restart")
+            .returning(File.id)
+        )
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
+
+    async def get_ingest_owners(self) -> set[str]:
+        query = (
+            select(File.ingest_owner)
+            .where(File.status == "processing", File.ingest_owner.is_not(None))
+            .distinct()
+        )
+        result = await self.session.execute(query)
+        return set(result.scalars().all())
+
+    async def get_columns(self, file_id: UUID) -> dict[str, str]:
+        query = (
+            select(FileColumn)
+            .where(FileColumn.file_id == file_id)
+            .order_by(FileColumn.position)
+        )
+        result = await self.session.execute(query)
+        file_columns = result.scalars().all()
+        self.column_ids[file_id] = {column.name: column.id for column in file_columns}
+        return {column.name: column.type for column in file_columns}
+
+    async def get_exact_types(self, file_id: UUID) -> dict[str, str]:
+        """Column types, with text for typed columns holding values that do not convert."""
+        columns = await self.get_columns(file_id)
+        mismatches = {}
+        for position, (column_name, column_type) in enumerate(columns.items()):
+            kind = value_kind(column_type)
+            if kind == "text":
+                continue
+            if self.layout == "row":
+                cell = func.coalesce(Record.cells[position + 1], "")
+                query = select(Record.id).where(
+                    Record.file_id == file_id, cell != "", ~convertible(cell, column_type)
+                )
+            else:
+                typed_value = Data.number_value if kind == "numeric" else Data.date_value
+                unconverted = typed_value.is_(None)
+                if column_type == "int":
+                    # number_value also holds ints beyond the int64 range.
+                    unconverted = ~convertible(Data.value, column_type)
+                query = select(Data.id).where(
+                    Data.file_id == file_id,
+                    Data.column_id == self._column_id(file_id, column_name),
+                    Data.value != "",
+                    unconverted,
+                )
+            mismatches[column_name] = query.exists()
+        if mismatches:
+            result = await self.session.execute(select(*mismatches.values()))
+            for column_name, mismatch in zip(mismatches, result.one()):
+                if mismatch:
+                    columns[column_name] = "text"
+        return columns
+
+    async def get_column_ids(self, file_id: UUID) -> dict[str, int]:
+        if file_id not in self.column_ids:
+            await self.get_columns(file_id)
+        return self.column_ids[file_id]
+
+    def _column_id(self, file_id: UUID, column_name: str) -> int | None:
+        return self.column_ids.get(file_id, {}).get(column_name)
+
+    async def rename_column(self, file_id: UUID, column_name: str, new_name: str) -> bool:
+        # Cells reference the column by id, so only the columns row changes.
+        query = (
+            update(FileColumn)
+            .where(FileColumn.file_id == file_id, FileColumn.name == column_name)
+            .values(name=new_name)
+        )
+        result = await self.session.execute(query)
+        if not result.rowcount:
+            return False
+        columns = await self.get_columns(file_id)
+        query_file = update(File).where(File.id == file_id).values(column_order=",".join(columns))
+        await self.session.execute(query_file)
+        self.changed_files.add(file_id)
+        return True
+
     async def create_data(
         self,
         file_id: UUID,
@@ -42,65 +281,764 @@ class DatabaseService:
         row_number: int,
         value: str,
     ) -> Data:
+        column_ids = await self.get_column_ids(file_id)
         db_data = Data(
-            file_id=file_id, column_name=column_name, row_number=row_number, value=value
+            file_id=file_id,
+            column_id=column_ids.get(column_name),
+            row_number=row_number,
+            value=value,
         )
         self.session.add(db_data)
         return db_data
 
+    async def bulk_create_data(
+        self,
+        file_id: UUID,
+        rows: Iterable[dict[str, str]],
+        batch_size: int | None = None,
+        column_types: dict[str, str] | None = None,
+    ) -> int:
+        batch_size = batch_size or INGEST_BATCH_SIZE
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+        column_names = list(first_row)
+        rows = (
+            [row.get(column_name) or "" for column_name in column_names]
+            for row in itertools.chain([first_row], rows)
+        )
+        batches = iter(lambda: list(itertools.islice(rows, batch_size)), [])
+        return await self.ingest_batches(file_id, column_names, batches, column_types)
+
+    async def ingest_batches(
+        self,
+        file_id: UUID,
+        column_names: list[str],
+        batches: Iterable[list[list[str]]],
+        column_types: dict[str, str] | None = None,
+        start_row: int = 0,
+    ) -> int:
+        column_types = [(column_types or {}).get(column_name) for column_name in column_names]
+        if self.layout == "row":
+            table = Record.__table__
+            columns = ("file_id", "row_number", "cells")
+        else:
+            table = Data.__table__
+            columns = ("file_id", "column_id", "row_number", "value", "number_value", "date_value")
+            column_ids = await self.get_column_ids(file_id)
+        row_number = start_row
+        for batch in batches:
+            records = []
+            documents = []
+            for row in batch:
+                if SEARCH_INDEX:
+                    documents.append((file_id, row_number, search_document(row)))
+                if self.layout == "row":
+                    records.append((file_id, row_number, row))
+                else:
+                    for column_name, column_type, value in zip(column_names, column_types, row):
+                        number_value, date_value = typed_values(value, column_type)
+                        records.append(
+                            (
+                                file_id,
+                                column_ids.get(column_name),
+                                row_number,
+                                value,
+                                number_value,
+                                date_value,
+                            )
+                        )
+                row_number += 1
+            if records:
+                await self._copy_records(table, columns, records)
+            if documents:
+                await self._copy_records(
+                    SearchDocument.__table__, ("file_id", "row_number", "document"), documents
+                )
+        return row_number - start_row
+
+    async def append_rows(
+        self, file_id: UUID, column_names: list[str], batches: Iterable[list[list[str]]]
+    ) -> tuple[int, int]:
+        # Locking the file row serializes appends, so row numbers never collide.
+        file = await self.session.scalar(
+            select(File).where(File.id == file_id).with_for_update()
+        )
+        if file is None:
+            return 0, 0
+        columns = await self.get_columns(file_id)
+        model = Record if self.layout == "row" else Data
+        last_row = await self.session.scalar(
+            select(func.max(model.row_number)).where(model.file_id == file_id)
+        )
+        start_row = 0 if last_row is None else last_row + 1
+        positions = [
+            column_names.index(name) if name in column_names else None for name in columns
+        ]
+        rows = (
+            [["" if position is None else row[position] for position in positions] for row in batch]
+            for batch in batches
+        )
+        row_count = await self.ingest_batches(
+            file.id, list(columns), rows, column_types=columns, start_row=start_row
+        )
+        self.changed_files.add(file_id)
+        return start_row, row_count
+
+    async def update_row(self, file_id: UUID, row_number: int, values: dict[str, str]) -> bool:
+        columns = await self.get_columns(file_id)
+        if self.layout == "row":
+            record = await self.session.scalar(
+                select(Record)
+                .where(Record.file_id == file_id, Record.row_number == row_number)
+                .with_for_update()
+            )
+            if record is None:
+                return False
+            cells = list(record.cells) + [""] * (len(columns) - len(record.cells))
+            for position, column_name in enumerate(columns):
+                if column_name in values:
+                    cells[position] = values[column_name]
+            record.cells = cells
+            await self.session.flush()
+        else:
+            exists = await self.session.scalar(
+                select(Data.id).where(Data.file_id == file_id, Data.row_number == row_number).limit(1)
+            )
+            if exists is None:
+                return False
+            table = Data.__table__
+            query = (
+                update(table)
+                .where(
+                    table.c.file_id == file_id,
+                    table.c.row_number == row_number,
+                    table.c.column_id == bindparam("cell_column_id"),
+                )
+                .values(
+                    value=bindparam("cell_value"),
+                    number_value=bindparam("cell_number_value"),
+                    date_value=bindparam("cell_date_value"),
+                )
+            )
+            parameters = []
+            for column_name, value in values.items():
+                number_value, date_value = typed_values(value, columns.get(column_name))
+                parameters.append(
+                    {
+                        "cell_column_id": self._column_id(file_id, column_name),
+                        "cell_value": value,
+                        "cell_number_value": number_value,
+                        "cell_date_value": date_value,
+                    }
+                )
+            if parameters:
+                await self.session.execute(query, parameters)
+        if SEARCH_INDEX:
+            await self.index_search_documents(file_id, [row_number])
+        self.changed_files.add(file_id)
+        return True
+
+    async def _copy_records(self, table, columns: tuple[str, ...], records: list[tuple]):
+        connection = await self.session.connection()
+        if connection.dialect.driver == "asyncpg":
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                table.name, records=records, columns=columns
+            )
+        else:
+            await connection.execute(
+                insert(table).values([dict(zip(columns, record)) for record in records])
+            )
+
     async def get_data(
         self,
         file_id: UUID,
         filters: dict[str, str] = None,
-    ) -> list[Data]:
-        query = (
-            select(Data)
-            .where(
-                Data.file_id == file_id
+        match_all: bool = True,
+        row_numbers: list[int] | None = None,
+        sort: dict[str, str] | None = None,
+        projection: list[str] | None = None,
+    ) -> list[Cell]:
+        columns = await self.get_columns(file_id)
+        query = self._data_query(file_id, columns, filters, match_all, row_numbers, sort)
+        if query is None:
+            return []
+        query = self._projected_query(query, file_id, columns, projection)
+        result = await self.session.execute(query)
+        if self.layout == "row":
+            return self._records_to_data(result.all(), projection or list(columns))
+        column_names = {column_id: name for name, column_id in self.column_ids[file_id].items()}
+        return [
+            Cell(item.file_id, item.row_number, column_names[item.column_id], item.value)
+            for item in result.scalars()
+        ]
+
+    async def stream_data(
+        self,
+        file_id: UUID,
+        filters: dict[str, str] = None,
+        match_all: bool = True,
+        row_numbers: list[int] | None = None,
+        sort: dict[str, str] | None = None,
+        batch_size: int | None = None,
+        projection: list[str] | None = None,
+    ) -> AsyncIterator[list[str]]:
+        columns = await self.get_columns(file_id)
+        query = self._data_query(file_id, columns, filters, match_all, row_numbers, sort)
+        if query is None:
+            return
+        query = self._projected_query(query, file_id, columns, projection)
+        execution_options = {"yield_per": batch_size or STREAM_BATCH_SIZE}
+        if self.layout == "row":
+            result = await self.session.stream(query, execution_options=execution_options)
+            async for _, _, cells in result:
+                yield cells
+            return
+        query = query.with_only_columns(Data.row_number, Data.column_id, Data.value)
+        result = await self.session.stream(query, execution_options=execution_options)
+        column_ids = [self._column_id(file_id, name) for name in projection or columns]
+        current_row_number = None
+        row = {}
+        async for row_number, column_id, value in result:
+            if row_number != current_row_number and row:
+                yield [row.get(column_id, "") for column_id in column_ids]
+                row = {}
+            current_row_number = row_number
+            row[column_id] = value
+        if row:
+            yield [row.get(column_id, "") for column_id in column_ids]
+
+    async def get_column_values(
+        self,
+        file_id: UUID,
+        filters: dict[str, str] = None,
+        match_all: bool = True,
+        row_numbers: list[int] | None = None,
+        sort: dict[str, str] | None = None,
+        projection: list[str] | None = None,
+    ) -> dict[str, list[str]]:
+        columns = await self.get_columns(file_id)
+        query = self._data_query(file_id, columns, filters, match_all, row_numbers, sort)
+        if query is None:
+            return {}
+        query = self._projected_query(query, file_id, columns, projection)
+        column_names = projection or list(columns)
+        # Plain Core rows: no ORM entities or identity map for cells that are only pivoted.
+        connection = await self.session.connection()
+        if self.layout == "row":
+            result = await connection.execute(query.with_only_columns(query.selected_columns.cells))
+            width = len(column_names)
+            rows = [cells + [""] * (width - len(cells)) for cells, in result]
+            if not rows:
+                return {}
+            return {name: list(values) for name, values in zip(column_names, zip(*rows))}
+        result = await connection.execute(
+            query.with_only_columns(Data.column_id, Data.value)
+        )
+        column_ids = {name: self._column_id(file_id, name) for name in column_names}
+        values = {column_id: [] for column_id in column_ids.values()}
+        appenders = {column_id: column.append for column_id, column in values.items()}
+        for column_id, value in result:
+            appenders[column_id](value)
+        return {name: values[column_id] for name, column_id in column_ids.items() if values[column_id]}
+
+    def _projected_query(
+        self,
+        query: Select,
+        file_id: UUID,
+        columns: dict[str, str],
+        projection: list[str] | None,
+    ) -> Select:
+        if self.layout == "row":
+            cells = Record.cells
+            if projection:
+                positions = [list(columns).index(name) + 1 for name in projection]
+                cells = array([Record.cells[position] for position in positions])
+            return query.with_only_columns(Record.file_id, Record.row_number, cells.label("cells"))
+        if projection:
+            column_ids = [self._column_id(file_id, name) for name in projection]
+            query = query.where(Data.column_id.in_(column_ids))
+        return query
+
+    async def stream_batches(
+        self,
+        file_id: UUID,
+        filters: dict[str, str] = None,
+        match_all: bool = True,
+        sort: dict[str, str] | None = None,
+        batch_size: int | None = None,
+        projection: list[str] | None = None,
+    ) -> AsyncIterator[list[list[str]]]:
+        batch_size = batch_size or STREAM_BATCH_SIZE
+        batch = []
+        rows = self.stream_data(
+            file_id,
+            filters=filters,
+            match_all=match_all,
+            sort=sort,
+            batch_size=batch_size,
+            projection=projection,
+        )
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def get_row_keys(
+        self,
+        file_id: UUID,
+        filters: dict[str, str] = None,
+        match_all: bool = True,
+        sort: dict[str, str] | None = None,
+        limit: int | None = None,
+        after: list | None = None,
+    ) -> list[tuple]:
+        columns = await self.get_columns(file_id)
+        query = self._row_keys_query(file_id, columns, filters, match_all, sort, after)
+        if query is None:
+            return []
+        result = await self.session.execute(query.limit(limit))
+        return [tuple(row) for row in result.all()]
+
+    def _row_keys_query(
+        self,
+        file_id: UUID,
+        columns: dict[str, str],
+        filters: dict[str, str] | None,
+        match_all: bool = True,
+        sort: dict[str, str] | None = None,
+        after: list | None = None,
+    ) -> Select | None:
+        if not columns:
+            return None
+        sort_columns = self._sort_columns(sort, columns)
+        if self.layout == "row":
+            query = self._record_query(file_id, columns, filters, match_all)
+            if query is None:
+                return None
+            row_number = Record.row_number
+            keys = [
+                (self._record_value(columns, column_name, kind), descending)
+                for column_name, descending, kind in sort_columns
+            ]
+            query = query.order_by(None)
+        else:
+            if filters:
+                matching_rows = self._matching_rows(file_id, columns, filters, match_all)
+                row_number = matching_rows.c.row_number
+                query = select(row_number).select_from(matching_rows)
+            else:
+                row_number = Data.row_number
+                query = select(row_number).where(
+                    Data.file_id == file_id,
+                    Data.column_id == self._column_id(file_id, next(iter(columns))),
+                )
+            keys = []
+            for column_name, descending, kind in sort_columns:
+                key_data = aliased(Data)
+                query = query.outerjoin(
+                    key_data,
+                    and_(
+                        key_data.file_id == file_id,
+                        key_data.column_id == self._column_id(file_id, column_name),
+                        key_data.row_number == row_number,
+                    ),
+                )
+                keys.append((self._data_value(key_data, columns[column_name], kind), descending))
+        keys = [
+            (key.label(f"sort_key_{position}"), descending)
+            for position, (key, descending) in enumerate(keys)
+        ]
+        keys.append((row_number.label("row_number"), False))
+        query = query.with_only_columns(*(key for key, _ in keys))
+        if after is not None:
+            query = query.where(keyset_condition(keys, after))
+        return query.order_by(*order_by(keys))
+
+    async def aggregate(
+        self,
+        file_id: UUID,
+        aggregates: list[tuple[str, str | None]],
+        group_by: list[str] | None = None,
+        filters: dict[str, str] = None,
+        match_all: bool = True,
+        limit: int | None = None,
+    ) -> list[dict]:
+        columns = await self.get_columns(file_id)
+        query = self._aggregate_query(
+            file_id, columns, aggregates, group_by or [], filters, match_all
+        )
+        if query is None:
+            return []
+        result = await self.session.execute(query.limit(limit))
+        return [dict(row._mapping) for row in result]
+
+    def _aggregate_query(
+        self,
+        file_id: UUID,
+        columns: dict[str, str],
+        aggregates: list[tuple[str, str | None]],
+        group_by: list[str],
+        filters: dict[str, str] | None,
+        match_all: bool = True,
+    ) -> Select | None:
+        if not columns:
+            return None
+        if self.layout == "row":
+            query = self._record_query(file_id, columns, filters, match_all)
+            if query is None:
+                return None
+            query = query.order_by(None)
+
+            def value(column_name: str, kind: str):
+                return self._record_value(columns, column_name, kind)
+
+        else:
+            if filters:
+                matching_rows = self._matching_rows(file_id, columns, filters, match_all)
+                row_number = matching_rows.c.row_number
+                query = select(row_number).select_from(matching_rows)
+            else:
+                row_number = Data.row_number
+                query = select(row_number).where(
+                    Data.file_id == file_id,
+                    Data.column_id == self._column_id(file_id, next(iter(columns))),
+                )
+            cells = {}
+            referenced = group_by + [column_name for _, column_name in aggregates if column_name]
+            for column_name in dict.fromkeys(referenced):
+                cells[column_name] = aliased(Data)
+                query = query.outerjoin(
+                    cells[column_name],
+                    and_(
+                        cells[column_name].file_id == file_id,
+                        cells[column_name].column_id == self._column_id(file_id, column_name),
+                        cells[column_name].row_number == row_number,
+                    ),
+                )
+
+            def value(column_name: str, kind: str):
+                return self._data_value(cells[column_name], columns[column_name], kind)
+
+        group_keys = [value(column_name, "text").label(column_name) for column_name in group_by]
+        selected = list(group_keys)
+        for function, column_name in aggregates:
+            if column_name is None:
+                expression = func.count()
+            else:
+                kind = "numeric" if function in NUMERIC_AGGREGATES else value_kind(columns[column_name])
+                typed_value = value(column_name, kind) if kind != "text" else None
+                expression = aggregate_expression(function, value(column_name, "text"), typed_value)
+            selected.append(expression.label(aggregate_label(function, column_name)))
+        query = query.with_only_columns(*selected)
+        if group_keys:
+            query = query.group_by(*group_keys).order_by(*group_keys)
+        return query
+
+    def _sort_columns(
+        self, sort: dict[str, str] | None, columns: dict[str, str]
+    ) -> list[tuple[str, bool, str]]:
+        sort_columns = []
+        for column_name, sort_query in (sort or {}).items():
+            if column_name in columns:
+                descending, kind = parse_sort(sort_query)
+                sort_columns.append((column_name, descending, kind or value_kind(columns[column_name])))
+        return sort_columns
+
+    def _data_value(self, data, column_type: str, kind: str):
+        if kind == value_kind(column_type) == "numeric":
+            return data.number_value
+        if kind == value_kind(column_type) == "date":
+            return data.date_value
+        return typed_expression(data.value, kind, column_type)
+
+    def _record_value(self, columns: dict[str, str], column_name: str, kind: str):
+        position = list(columns).index(column_name) + 1
+        return typed_expression(Record.cells[position], kind, columns[column_name])
+
+    def _data_query(
+        self,
+        file_id: UUID,
+        columns: dict[str, str],
+        filters: dict[str, str] | None,
+        match_all: bool = True,
+        row_numbers: list[int] | None = None,
+        sort: dict[str, str] | None = None,
+    ) -> Select | None:
+        model = Record if self.layout == "row" else Data
+        if row_numbers is not None:
+            row_numbers_array = literal(row_numbers, ARRAY(Integer))
+            query = select(model).where(
+                model.file_id == file_id, model.row_number == any_(row_numbers_array)
+            )
+            return query.order_by(
+                func.array_position(row_numbers_array, model.row_number),
+                *self._cell_order(model),
             )
+        if sort:
+            sorted_rows = self._row_keys_query(file_id, columns, filters, match_all, sort)
+            if sorted_rows is None:
+                return None
+            sorted_rows = sorted_rows.order_by(None).subquery("sorted_rows")
+            sort_columns = self._sort_columns(sort, columns)
+            keys = [
+                (sorted_rows.c[f"sort_key_{position}"], descending)
+                for position, (_, descending, _) in enumerate(sort_columns)
+            ]
+            query = (
+                select(model)
+                .join(sorted_rows, model.row_number == sorted_rows.c.row_number)
+                .where(model.file_id == file_id)
+            )
+            return query.order_by(*order_by(keys), *self._cell_order(model))
+        if self.layout == "row":
+            return self._record_query(file_id, columns, filters, match_all)
+        query = select(Data).where(Data.file_id == file_id)
+        if filters:
+            matching_rows = self._matching_rows(file_id, columns, filters, match_all)
+            query = query.join(matching_rows, Data.row_number == matching_rows.c.row_number)
+        return query.order_by(*self._cell_order(Data))
+
+    def _cell_order(self, model) -> tuple:
+        if model is Record:
+            return (Record.row_number,)
+        return (Data.row_number, Data.id)
+
+    def _matching_rows(
+        self,
+        file_id: UUID,
+        columns: dict[str, str],
+        filters: dict[str, str],
+        match_all: bool,
+    ):
+        filter_conditions = []
+        for column_name, query in filters.items():
+            kind = value_kind(columns.get(column_name))
+            typed_value = self._data_value(Data, columns.get(column_name), kind)
+            filter_conditions.append(
+                and_(
+                    Data.column_id == self._column_id(file_id, column_name),
+                    filter_condition(Data.value, query, typed_value, kind),
+                )
+            )
+        matching_rows = (
+            select(Data.row_number)
+            .where(Data.file_id == file_id, or_(*filter_conditions))
+            .group_by(Data.row_number)
         )
+        if match_all:
+            matching_rows = matching_rows.having(func.count() == len(filter_conditions))
+        return matching_rows.cte("matching_rows")
 
+    def _record_query(
+        self,
+        file_id: UUID,
+        columns: dict[str, str],
+        filters: dict[str, str] | None,
+        match_all: bool = True,
+    ) -> Select | None:
+        query = (
+            select(Record)
+            .where(Record.file_id == file_id)
+            .order_by(Record.row_number)
+        )
         if filters:
             filter_conditions = []
-            for column_name, value in filters.items():
-                try:
-                    filter_conditions.append(
-                        and_(Data.column_name == column_name, Data.value.ilike(f"%{value}%"))
+            for column_name, filter_query in filters.items():
+                if column_name not in columns:
+                    if match_all:
+                        return None
+                    continue
+                kind = value_kind(columns[column_name])
+                filter_conditions.append(
+                    filter_condition(
+                        self._record_value(columns, column_name, "text"),
+                        filter_query,
+                        self._record_value(columns, column_name, kind),
+                        kind,
                     )
-                except AttributeError:
-                    print(f"Attribute not found {column_name}")
-            if filter_conditions:
-                subquery = (
-                    select(Data.row_number)
-                    .where(Data.file_id == file_id, or_(*filter_conditions))
-                    .group_by(Data.row_number)
-                    .having(func.count() == len(filter_conditions))
-                ).alias("sq")
-                query = query.where(
-                    exists().where(and_(Data.row_number == subquery.c.row_number))
                 )
+            if not filter_conditions:
+                return None
+            query = query.where(and_(*filter_conditions) if match_all else or_(*filter_conditions))
+        return query
+
+    def _records_to_data(self, records: Iterable[Record], column_names: list[str]) -> list[Cell]:
+        return [
+            Cell(record.file_id, record.row_number, column_name, value)
+            for record in records
+            for column_name, value in zip(column_names, record.cells)
+        ]
+
+    async def explain_data(
+        self,
+        file_id: UUID,
+        filters: dict[str, str] | None = None,
+        match_all: bool = True,
+    ) -> dict:
+        columns = await self.get_columns(file_id)
+        query = self._data_query(file_id, columns, filters, match_all)
+        if query is None:
+            return {"uses_index": False, "indexes": [], "seq_scans": [], "plan": None}
+        result = await self.session.execute(Explain(query))
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        relations = (
+            Data.__tablename__,
+            Record.__tablename__,
+            *partition_names(Data.__tablename__, DATA_PARTITIONS),
+        )
+        return summarize_plan(plan[0]["Plan"], relations)
 
+    async def index_search_documents(
+        self, file_id: UUID, row_numbers: list[int] | None = None
+    ) -> int:
+        model = Record if self.layout == "row" else Data
+        conditions = [model.file_id == file_id]
+        document_conditions = [SearchDocument.file_id == file_id]
+        if row_numbers is not None:
+            row_numbers_array = literal(row_numbers, ARRAY(Integer))
+            conditions.append(model.row_number == any_(row_numbers_array))
+            document_conditions.append(SearchDocument.row_number == any_(row_numbers_array))
+        if self.layout == "row":
+            document = func.array_to_string(func.array_remove(Record.cells, ""), "\n")
+            rows = select(Record.file_id, Record.row_number, document).where(*conditions)
+        else:
+            document = func.string_agg(
+                func.nullif(Data.value, ""), aggregate_order_by(literal("\n"), FileColumn.position)
+            )
+            rows = (
+                select(Data.file_id, Data.row_number, func.coalesce(document, ""))
+                .join(FileColumn, FileColumn.id == Data.column_id)
+                .where(*conditions)
+                .group_by(Data.file_id, Data.row_number)
+            )
+        await self.session.execute(delete(SearchDocument).where(*document_conditions))
+        query = insert(SearchDocument).from_select(["file_id", "row_number", "document"], rows)
         result = await self.session.execute(query)
-        return list(result.scalars().all())
+        return result.rowcount
+
+    async def convert_file_layout(self, file_id: UUID, layout: str) -> int:
+        if layout not in STORAGE_LAYOUTS:
+            raise UnknownStorageLayout(layout)
+        if layout == "row":
+            rows = (
+                select(
+                    Data.file_id,
+                    Data.row_number,
+                    func.array_agg(aggregate_order_by(Data.value, FileColumn.position)),
+                )
+                .join(FileColumn, FileColumn.id == Data.column_id)
+                .where(Data.file_id == file_id)
+                .group_by(Data.file_id, Data.row_number)
+            )
+            query = insert(Record).from_select(["file_id", "row_number", "cells"], rows)
+            old_rows = delete(Data).where(Data.file_id == file_id)
+        else:
+            value = func.coalesce(Record.cells[FileColumn.position + 1], "")
+            column_type = FileColumn.type
+            cells = (
+                select(
+                    Record.file_id,
+                    FileColumn.id,
+                    Record.row_number,
+                    value,
+                    case(
+                        (column_type.in_(("int", "float")), typed_expression(value, "numeric")),
+                        (column_type == "bool", typed_expression(value, "numeric", "bool")),
+                    ),
+                    case((column_type == "date", typed_expression(value, "date"))),
+                )
+                .join(FileColumn, FileColumn.file_id == Record.file_id)
+                .where(Record.file_id == file_id)
+            )
+            query = insert(Data).from_select(
+                ["file_id", "column_id", "row_number", "value", "number_value", "date_value"],
+                cells,
+            )
+            old_rows = delete(Record).where(Record.file_id == file_id)
+        result = await self.session.execute(query)
+        await self.session.execute(old_rows)
+        return result.rowcount
 
     async def get_files(self, user_id: UUID) -> list[File]:
         query = (
             select(File)
             .outerjoin(FileAccess, File.id == FileAccess.file_id)
-            .where(or_(FileAccess.user_id == user_id, File.owner_id == user_id))
+            .where(
+                or_(FileAccess.user_id == user_id, File.owner_id == user_id),
+                File.status != "deleted",
+            )
         )
         result = await self.session.execute(query)
         return list(result.scalars().all())
 
+    async def search(
+        self, user_id: UUID, query: str, limit: int | None = None
+    ) -> list[tuple[UUID, str, int, float]]:
+        tsquery = func.websearch_to_tsquery("simple", query)
+        rank = func.ts_rank_cd(SearchDocument.vector, tsquery) + func.word_similarity(
+            query, SearchDocument.document
+        )
+        shared = (
+            select(FileAccess.id)
+            .where(FileAccess.file_id == File.id, FileAccess.user_id == user_id)
+            .exists()
+        )
+        statement = (
+            select(SearchDocument.file_id, File.name, SearchDocument.row_number, rank.label("rank"))
+            .join(File, File.id == SearchDocument.file_id)
+            .where(
+                File.status == "ready",
+                or_(File.owner_id == user_id, shared),
+                or_(
+                    SearchDocument.vector.bool_op("@@")(tsquery),
+                    SearchDocument.document.icontains(query, autoescape=True),
+                ),
+            )
+            .order_by(rank.desc(), SearchDocument.file_id, SearchDocument.row_number)
+            .limit(limit or SEARCH_LIMIT)
+        )
+        result = await self.session.execute(statement)
+        return [tuple(row) for row in result.all()]
+
     async def delete_file(self, file_id: UUID) -> bool:
+        # Only marks the file; its cells are reclaimed in batches by purge_file.
         query_file_access = delete(FileAccess).where(FileAccess.file_id == file_id)
-        query_data = delete(Data).where(Data.file_id == file_id)
-        query_file = delete(File).where(File.id == file_id)
+        query_file = (
+            update(File)
+            .where(File.id == file_id, File.status != "deleted")
+            .values(status="deleted")
+        )
         await self.session.execute(query_file_access)
-        await self.session.execute(query_data)
         result = await self.session.execute(query_file)
+        self.changed_files.add(file_id)
         return result.rowcount > 0
 
+    async def get_deleted_files(self) -> list[UUID]:
+        query = select(File.id).where(File.status == "deleted")
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
+
+    async def purge_file(self, file_id: UUID, batch_size: int | None = None) -> int:
+        batch_size = batch_size or RECLAIM_BATCH_SIZE
+        for model in (Data, Record, SearchDocument, FileColumn):
+            batch = select(model.id).where(model.file_id == file_id).limit(batch_size)
+            # The file_id condition lets Postgres prune the other partitions of data.
+            query = delete(model).where(model.file_id == file_id, model.id.in_(batch))
+            result = await self.session.execute(query)
+            if result.rowcount:
+                return result.rowcount
+        query_file = delete(File).where(File.id == file_id, File.status == "deleted")
+        result = await self.session.execute(query_file)
+        return result.rowcount
+
     async def create_file_access(self, file_id: UUID, user_id: UUID) -> FileAccess:
         db_file_access = FileAccess(file_id=file_id, user_id=user_id)
         self.session.add(db_file_access)
@@ -122,7 +1060,16 @@ class DatabaseService:
         return result.scalar_one_or_none() is not None
 
     async def commit(self):
+        if self.changed_files:
+            query = (
+                update(File)
+                .where(File.id.in_(self.changed_files))
+                .values(version=File.version + 1)
+            )
+            await self.session.execute(query)
         await self.session.commit()
+        self.changed_files.clear()
 
     async def rollback(self):
         await self.session.rollback()
+        self.changed_files.clear()
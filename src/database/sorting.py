@@ -0,0 +1,52 @@
+from datetime import date
+from sqlalchemy import and_, false, literal, or_
+from .column_types import VALUE_KINDS
+from ..errors import InvalidCursor
+
+SORT_DIRECTIONS = ("asc", "desc")
+
+
+def parse_sort(query: str) -> tuple[bool, str | None]:
+    direction, _, kind = query.partition(":")
+    if direction not in SORT_DIRECTIONS or (kind and kind not in VALUE_KINDS):
+        raise ValueError(f"Invalid sort {query}")
+    return direction == "desc", kind or None
+
+
+def order_by(keys: list[tuple]) -> list:
+    return [
+        key.desc().nulls_last() if descending else key.asc().nulls_last()
+        for key, descending in keys
+    ]
+
+
+def cursor_value(value, key_type):
+    # Cursors come back from clients, so each value must fit the type of its key.
+    python_type = key_type.python_type
+    if python_type is str and isinstance(value, str):
+        return value
+    if python_type is date and isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise InvalidCursor
+    if isinstance(value, bool):
+        raise InvalidCursor
+    if python_type is float and isinstance(value, (int, float)):
+        return float(value)
+    if python_type is int and isinstance(value, int):
+        return value
+    raise InvalidCursor
+
+
+def keyset_condition(keys: list[tuple], after: list):
+    (key, descending), value = keys[0], after[0]
+    if value is None:
+        if len(keys) == 1:
+            return false()
+        return and_(key.is_(None), keyset_condition(keys[1:], after[1:]))
+    value = literal(cursor_value(value, key.type), key.type)
+    beyond = key < value if descending else key > value
+    if len(keys) == 1:
+        return beyond
+    return or_(beyond, key.is_(None), and_(key == value, keyset_condition(keys[1:], after[1:])))
@@ -16,3 +16,28 @@ class TokenExpiredException(Exception):
 class CSVValidationError(Exception):
     def __init__(self) -> None:
         super().__init__("Could not validate file")
+
+
+class UnknownStorageLayout(Exception):
+    def __init__(self, layout: str) -> None:
+        super().__init__(f"Unknown storage layout {layout}")
+
+
+class UnknownPasswordExecutor(Exception):
+    def __init__(self, executor: str) -> None:
+        super().__init__(f"Unknown password hash executor {executor}")
+
+
+class InvalidCursor(Exception):
+    def __init__(self) -> None:
+        super().__init__("Invalid cursor")
+
+
+class IngestLeaseLost(Exception):
+    def __init__(self) -> None:
+        super().__init__("File is no longer ingested by this server process")
+
+
+class ExportConversionError(Exception):
+    def __init__(self, value: str, column_type: str) -> None:
+        super().__init__(f"Value {value!r} cannot be exported as {column_type}")
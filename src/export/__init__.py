@@ -0,0 +1 @@
+from .writers import EXPORT_EXTENSIONS, EXPORT_FORMATS, EXPORT_MEDIA_TYPES, content_disposition, export_table, pa
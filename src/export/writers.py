@@ -0,0 +1,143 @@
+import asyncio
+import csv
+import io
+from typing import AsyncIterator, Iterator
+from urllib.parse import quote
+
+from ..csv_processor import convert_value
+from ..errors import ExportConversionError
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = pa_ipc = pa_parquet = None
+
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+EXPORT_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "csv": "text/csv",
+}
+EXPORT_EXTENSIONS = {"parquet": "parquet", "arrow": "arrows", "csv": "csv"}
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+
+def content_disposition(filename: str) -> str:
+    # Headers are sent as latin-1, so the name goes in an ASCII fallback and,
+    # percent-encoded as UTF-8, in filename* (RFC 6266).
+    fallback = "".join(
+        char if " " <= char <= "~" and char not in '"\\' else "_" for char in filename
+    )
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain.
+
+    Keeps counting the position across drains, which the Parquet footer needs
+    for its column chunk offsets.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_schema(column_names: list[str], column_types: list[str]):
+    arrow_types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+        "date": pa.date32(),
+        "text": pa.string(),
+    }
+    return pa.schema(
+        [pa.field(name, arrow_types.get(column_type, pa.string()))
+         for name, column_type in zip(column_names, column_types)]
+    )
+
+
+def _typed_column(values: Iterator[str], column_type: str) -> list:
+    if column_type == "text":
+        return list(values)
+    converted = []
+    for value in values:
+        typed_value = convert_value(value, column_type) if value else None
+        if value and typed_value is None:
+            # Writing null would silently drop the value.
+            raise ExportConversionError(value, column_type)
+        if column_type == "int" and typed_value is not None:
+            # convert_value gives a float, which rounds integers beyond 2**53.
+            typed_value = int(value)
+            if not INT64_MIN <= typed_value <= INT64_MAX:
+                raise ExportConversionError(value, column_type)
+        converted.append(typed_value)
+    if column_type == "bool":
+        return [None if value is None else bool(value) for value in converted]
+    return converted
+
+
+def record_batch(rows: list[list[str]], schema, column_types: list[str]):
+    columns = [
+        pa.array(_typed_column((row[i] for row in rows), column_type), field.type)
+        for i, (field, column_type) in enumerate(zip(schema, column_types))
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def csv_chunk(rows: list[list[str]], header: list[str] | None = None) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def export_table(
+    batches: AsyncIterator[list[list[str]]],
+    column_names: list[str],
+    column_types: list[str],
+    export_format: str,
+) -> AsyncIterator[bytes]:
+    if export_format == "csv":
+        yield csv_chunk([], column_names)
+        async for rows in batches:
+            yield await asyncio.to_thread(csv_chunk, rows)
+        return
+    schema = arrow_schema(column_names, column_types)
+    sink = ChunkSink()
+    if export_format == "parquet":
+        writer = pa_parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa_ipc.new_stream(sink, schema)
+    try:
+        async for rows in batches:
+            batch = await asyncio.to_thread(record_batch, rows, schema, column_types)
+            await asyncio.to_thread(writer.write_batch, batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
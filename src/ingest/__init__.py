@@ -0,0 +1 @@
+from .jobs import INGEST_OWNER, INGEST_RECOVER, IngestJob, IngestQueue, clean_spool_dir, ingest_queue, spool_upload
@@ -0,0 +1,254 @@
+import asyncio
+import contextlib
+import glob
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, AsyncIterator, Collection
+from uuid import UUID, uuid4
+
+from ..csv_processor import PARSE_CHUNK_BYTES, CSVProcessor, parallel_batches, splittable
+from ..database import DatabaseService, async_session
+from ..errors import IngestLeaseLost
+
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR") or tempfile.gettempdir()
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", 1000))
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", 0))
+INGEST_RECOVER = os.getenv("INGEST_RECOVER", "true").lower() in ("1", "true", "yes")
+INGEST_HEARTBEAT_INTERVAL = float(os.getenv("INGEST_HEARTBEAT_INTERVAL", 10))
+INGEST_LEASE_TIMEOUT = float(os.getenv("INGEST_LEASE_TIMEOUT", 60))
+# Owner of this server process's ingest jobs and spool files.
+INGEST_OWNER = f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
+SPOOL_CHUNK_SIZE = 1024 * 1024
+SPOOL_PREFIX = "ingest-"
+
+logger = logging.getLogger(__name__)
+
+
+def spool_upload(file: IO, owner: str = INGEST_OWNER) -> str:
+    with tempfile.NamedTemporaryFile(
+        dir=INGEST_SPOOL_DIR, prefix=f"{SPOOL_PREFIX}{owner}-", suffix=".csv", delete=False
+    ) as spool:
+        shutil.copyfileobj(file, spool, SPOOL_CHUNK_SIZE)
+    return spool.name
+
+
+def spool_owner(path: str) -> str:
+    # Temporary file names end in a random part without dashes.
+    return os.path.basename(path)[len(SPOOL_PREFIX):-len(".csv")].rpartition("-")[0]
+
+
+def clean_spool_dir(
+    live_owners: Collection[str] = (), min_age: float = INGEST_LEASE_TIMEOUT
+) -> int:
+    """Removes spool files of owners without a live lease.
+
+    Uploads are spooled before their file and its lease exist, so files
+    younger than min_age are kept too.
+    """
+    removed = 0
+    cutoff = time.time() - min_age
+    for path in glob.glob(os.path.join(INGEST_SPOOL_DIR, f"{SPOOL_PREFIX}*.csv")):
+        if spool_owner(path) in live_owners:
+            continue
+        with contextlib.suppress(FileNotFoundError):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+class IngestJob:
+    def __init__(self, file_id: UUID, path: str) -> None:
+        self.file_id = file_id
+        self.path = path
+        self.status = "queued"
+        self.rows_ingested = 0
+        self.bytes_processed = 0
+        self.total_bytes = os.path.getsize(path)
+        self.error = None
+
+    def __repr__(self) -> str:
+        return f"IngestJob(file_id={self.file_id}, status={self.status}, rows_ingested={self.rows_ingested})"
+
+
+async def sequential_batches(
+    processor: CSVProcessor, file: IO
+) -> AsyncIterator[tuple[list[list[str]], int]]:
+    while batch := await asyncio.to_thread(next, processor.batches, None):
+        yield batch, file.tell()
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        workers: int = INGEST_WORKERS,
+        parse_workers: int = INGEST_PARSE_WORKERS,
+        chunk_bytes: int = PARSE_CHUNK_BYTES,
+        owner: str = INGEST_OWNER,
+    ) -> None:
+        self.workers = workers
+        self.owner = owner
+        self.parse_workers = parse_workers
+        self.chunk_bytes = chunk_bytes
+        self.jobs: OrderedDict[UUID, IngestJob] = OrderedDict()
+        self.queue: asyncio.Queue | None = None
+        self.tasks: list[asyncio.Task] = []
+        self.parse_executor: ProcessPoolExecutor | None = None
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self.heartbeat()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queue = None
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
+            self.parse_executor = None
+
+    async def submit(self, job: IngestJob):
+        if self.queue is None:
+            await self.start()
+        self.jobs[job.file_id] = job
+        await self.queue.put(job)
+
+    def get_parse_executor(self) -> ProcessPoolExecutor:
+        if self.parse_executor is None:
+            self.parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self.parse_executor
+
+    async def recover(self) -> list[UUID]:
+        # Jobs only live in the memory of the process running them, which renews
+        # their leases; a job whose lease expired was cut off by a restart.
+        try:
+            async with async_session() as session:
+                service = DatabaseService(session)
+                file_ids = await service.fail_expired_ingests(INGEST_LEASE_TIMEOUT)
+                live_owners = await service.get_ingest_owners()
+                await service.commit()
+        except Exception:
+            # Without the live leases, spool files of running jobs are not known.
+            logger.exception("Could not mark interrupted ingest jobs as failed")
+            return []
+        await asyncio.to_thread(clean_spool_dir, live_owners | {self.owner})
+        return file_ids
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(INGEST_HEARTBEAT_INTERVAL)
+            try:
+                await self.renew_leases()
+            except Exception:
+                logger.exception("Could not renew ingest leases")
+
+    async def renew_leases(self):
+        jobs = [job for job in self.jobs.values() if job.status in ("queued", "processing")]
+        if not jobs:
+            return
+        async with async_session() as session:
+            service = DatabaseService(session)
+            for job in jobs:
+                await service.renew_ingest_lease(
+                    job.file_id, self.owner, job.rows_ingested, job.bytes_processed
+                )
+            await service.commit()
+
+    def get(self, file_id: UUID) -> IngestJob | None:
+        return self.jobs.get(file_id)
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.run(job)
+            except Exception:
+                logger.exception("Ingest job for file %s failed", job.file_id)
+            finally:
+                self.queue.task_done()
+                self.forget_finished()
+
+    async def run(self, job: IngestJob):
+        job.status = "processing"
+        try:
+            with open(job.path, "rb") as file:
+                processor = await asyncio.to_thread(CSVProcessor, file)
+                if (
+                    self.parse_workers > 0
+                    and job.total_bytes > self.chunk_bytes
+                    and splittable(processor.dialect)
+                ):
+                    # Chunks are parsed in worker processes but written in file
+                    # order, so row numbers keep counting from rows_ingested.
+                    batches = parallel_batches(
+                        job.path,
+                        processor.dialect,
+                        len(processor.column_names or []),
+                        self.get_parse_executor(),
+                        processor.batch_size,
+                        self.chunk_bytes,
+                        window=2 * self.parse_workers,
+                    )
+                else:
+                    batches = sequential_batches(processor, file)
+                async with async_session() as session:
+                    service = DatabaseService(session)
+                    async for batch, bytes_processed in batches:
+                        await service.ingest_batches(
+                            job.file_id,
+                            processor.column_names,
+                            [batch],
+                            column_types=processor.column_types,
+                            start_row=job.rows_ingested,
+                        )
+                        job.rows_ingested += len(batch)
+                        job.bytes_processed = bytes_processed
+                    finished = await service.end_ingest(
+                        job.file_id, self.owner, "ready", job.rows_ingested, job.total_bytes
+                    )
+                    if not finished:
+                        raise IngestLeaseLost
+                    await service.commit()
+            job.bytes_processed = job.total_bytes
+            job.status = "ready"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e) or e.__class__.__name__
+            try:
+                async with async_session() as session:
+                    service = DatabaseService(session)
+                    await service.end_ingest(
+                        job.file_id,
+                        self.owner,
+                        "failed",
+                        job.rows_ingested,
+                        job.bytes_processed,
+                        job.error,
+                    )
+                    await service.commit()
+            except Exception:
+                logger.exception("Could not mark file %s as failed", job.file_id)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(job.path)
+
+    def forget_finished(self):
+        finished = [
+            file_id for file_id, job in self.jobs.items() if job.status in ("ready", "failed")
+        ]
+        for file_id in finished[:max(len(finished) - INGEST_JOB_HISTORY, 0)]:
+            del self.jobs[file_id]
+
+
+ingest_queue = IngestQueue()
@@ -24,12 +24,40 @@ class File(BaseModel):
     name: str
     owner_id: UUID
     column_order: str
+    status: str
 
     class Config:
         from_attributes = True
 
 
+class SearchResult(BaseModel):
+    file_id: UUID
+    file_name: str
+    row_number: int
+    rank: float
+
+
+class IngestStatus(BaseModel):
+    file_id: UUID
+    status: str
+    rows_ingested: int | None = None
+    bytes_processed: int | None = None
+    total_bytes: int | None = None
+    error: str | None = None
+
+
 class FileAccess(BaseModel):
     file_id: UUID
     user_id: UUID
     username: UUID
+
+
+class PoolStatus(BaseModel):
+    size: int
+    max_overflow: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    connects: int
+    checkouts: int
+    invalidations: int
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from ..auth.jwt import create_access_token
-from ..auth.password import get_password_hash, verify_password
+from ..auth.password import get_password_hash_async, verify_password_async
 from ..database import get_db_service, DatabaseService
 from sqlalchemy.exc import IntegrityError
 from ..models import Token, Credentials
@@ -18,7 +18,7 @@ async def register(
     credentials: Credentials,
     service: DatabaseService = Depends(get_db_service),
 ):
-    hashed_password = get_password_hash(credentials.password)
+    hashed_password = await get_password_hash_async(credentials.password)
     await service.create_user(credentials.username, hashed_password)
     try:
         await service.commit()
@@ -35,12 +35,15 @@ async def login_for_access_token(
     credentials: Credentials, service: DatabaseService = Depends(get_db_service)
 ):
     user = await service.get_user(credentials.username)
+    # End the read to return the connection to the pool before the slow
+    # password check; a commit, unlike a rollback, keeps user loaded.
+    await service.commit()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect username or password",
         )
-    if not verify_password(credentials.password, user.hashed_password):
+    if not await verify_password_async(credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect username or password",
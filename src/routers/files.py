@@ -1,6 +1,7 @@
 from ast import Str
 import asyncio
-from collections import defaultdict
+import os
+from typing import Literal
 from uuid import UUID
 from fastapi import (
     APIRouter,
@@ -10,15 +11,32 @@ from fastapi import (
     UploadFile,
     status,
     HTTPException,
+    Query,
 )
+from fastapi.responses import StreamingResponse
 
-from ..errors import CSVValidationError
+from ..cache import Materialized, materialized_cache, materialized_key, serialize
+from ..errors import CSVValidationError, InvalidCursor
 
-from ..database.service import DatabaseService
-from .utils import get_current_user, sort_table
-from ..models import User, File, FileAccess
+from ..database.aggregates import parse_aggregate
+from ..database.reclaim import file_reclaimer
+from ..database.service import SEARCH_LIMIT, DatabaseService
+from .utils import (
+    STREAM_MEDIA_TYPES,
+    FileACL,
+    decode_cursor,
+    encode_cursor,
+    get_current_user,
+    parse_projection,
+    parse_table_query,
+    materialized_response,
+    stream_table,
+)
+from ..models import User, File, FileAccess, IngestStatus, SearchResult
 from ..csv_processor import CSVProcessor
 from ..database import get_db_service
+from ..export import EXPORT_EXTENSIONS, EXPORT_MEDIA_TYPES, content_disposition, export_table, pa
+from ..ingest import IngestJob, ingest_queue, spool_upload
 
 router = APIRouter(prefix="/files", tags=["files"])
 
@@ -35,28 +53,59 @@ async def upload_new_file(
     if file.content_type != "text/csv":
         raise wrong_file_type
     try:
-        processor = CSVProcessor(file.file)
-        new_file = await service.create_file(
-            file.filename, user.id, ",".join(processor.column_names)
-        )
-        await service.commit()
-        tasks = []
-        for row_number, row in enumerate(processor):
-            for column_name, value in row.items():
-                tasks.append(
-                    asyncio.create_task(
-                        service.create_data(new_file.id, column_name, row_number, value)
-                    )
-                )
-        await asyncio.gather(*tasks)
-        await service.commit()
-    except CSVValidationError:
-        raise wrong_file_type
+        path = await asyncio.to_thread(spool_upload, file.file, ingest_queue.owner)
     finally:
         file.file.close()
+    try:
+        with open(path, "rb") as spooled_file:
+            processor = await asyncio.to_thread(CSVProcessor, spooled_file)
+    except CSVValidationError:
+        os.remove(path)
+        raise wrong_file_type
+    new_file = await service.create_file(
+        file.filename,
+        user.id,
+        processor.column_names,
+        list(processor.column_types.values()),
+        status="processing",
+        ingest_owner=ingest_queue.owner,
+        total_bytes=os.path.getsize(path),
+    )
+    await service.commit()
+    await ingest_queue.submit(IngestJob(new_file.id, path))
     return new_file.id
 
 
+@router.get("/{file_id}/status", response_model=IngestStatus)
+async def get_upload_status(
+    file_id: str,
+    service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
+):
+    file = await acl.require(
+        file_id, "read", f"You are not able to get data from file id {file_id}"
+    )
+    job = ingest_queue.get(file.id)
+    if job:
+        return IngestStatus(
+            file_id=file.id,
+            status=job.status,
+            rows_ingested=job.rows_ingested,
+            bytes_processed=job.bytes_processed,
+            total_bytes=job.total_bytes,
+            error=job.error,
+        )
+    # The job may run in another server process, which records its progress on the file.
+    return IngestStatus(
+        file_id=file.id,
+        status=file.status,
+        rows_ingested=file.rows_ingested,
+        bytes_processed=file.bytes_processed,
+        total_bytes=file.total_bytes,
+        error=file.ingest_error,
+    )
+
+
 @router.get("/")
 async def get_available_files(
     user: User = Depends(get_current_user),
@@ -66,27 +115,34 @@ async def get_available_files(
     return list(map(File.model_validate, db_files))
 
 
+@router.get("/search", response_model=list[SearchResult])
+async def search_files(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(SEARCH_LIMIT, ge=1, le=1000),
+    user: User = Depends(get_current_user),
+    service: DatabaseService = Depends(get_db_service),
+):
+    results = await service.search(user.id, q, limit=limit)
+    return [
+        SearchResult(file_id=file_id, file_name=file_name, row_number=row_number, rank=rank)
+        for file_id, file_name, row_number, rank in results
+    ]
+
+
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: str,
-    user: User = Depends(get_current_user),
     service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
 ):
-    file = await service.get_file(UUID(file_id))
-    if not file:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"File with id {file_id} not found",
-        )
-    if file.owner_id != user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"You are not the owner of file with id {file_id}",
-        )
+    file = await acl.require(
+        file_id, "owner", f"You are not the owner of file with id {file_id}"
+    )
     res = await service.delete_file(file.id)
     await service.commit()
     if not res:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    file_reclaimer.notify()
     return Response("Success")
 
 
@@ -94,64 +150,295 @@ async def delete_file(
 async def get_file_data(
     file_id: str,
     request: Request,
-    user: User = Depends(get_current_user),
+    match: Literal["all", "any"] = "all",
+    stream: Literal["ndjson", "csv", "json"] | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    columns: str | None = None,
     service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
 ):
-    file = await service.get_file(UUID(file_id))
-    if not file:
+    file = await acl.require(
+        file_id, "read", f"You are not able to get data from file id {file_id}"
+    )
+    if file.status != "ready":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"File with id {file_id} not found",
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File with id {file_id} is {file.status}",
+        )
+    column_names = file.column_order.split(",")
+    filters, sort = parse_table_query(request, column_names)
+    projection = parse_projection(columns, column_names)
+    cache_key = None
+    if not stream:
+        signature = (
+            match,
+            tuple(sorted(filters.items())),
+            tuple(sort.items()),
+            limit,
+            cursor,
+            tuple(projection or ()),
         )
-    if file.owner_id != user.id:
-        has_access = await service.has_access(file.id, user.id)
-        if not has_access:
+        cache_key = materialized_key(file.id, file.version, signature)
+        materialized = await materialized_cache.get(cache_key)
+        if materialized:
+            return materialized_response(materialized, request)
+    row_numbers = None
+    headers = {}
+    if limit or cursor:
+        after = decode_cursor(cursor) if cursor else None
+        if after and len(after) != len(sort) + 1:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Cursor does not match the requested sort",
+            )
+        try:
+            row_keys = await service.get_row_keys(
+                file.id,
+                filters=filters,
+                match_all=match == "all",
+                sort=sort,
+                limit=limit,
+                after=after,
+            )
+        except InvalidCursor:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"You are not able to get data from file id {file_id}",
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Invalid cursor",
             )
+        row_numbers = [key[-1] for key in row_keys]
+        if limit and len(row_keys) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(list(row_keys[-1]))
+    if stream:
+        rows = service.stream_data(
+            file.id,
+            filters=filters,
+            match_all=match == "all",
+            row_numbers=row_numbers,
+            sort=sort,
+            projection=projection,
+        )
+        return StreamingResponse(
+            stream_table(rows, projection or column_names, stream),
+            media_type=STREAM_MEDIA_TYPES[stream],
+            headers=headers,
+        )
+    data = await service.get_column_values(
+        file.id,
+        filters=filters,
+        match_all=match == "all",
+        row_numbers=row_numbers,
+        sort=sort,
+        projection=projection,
+    )
+    materialized = Materialized(serialize(data), headers)
+    await materialized_cache.set(cache_key, materialized)
+    return materialized_response(materialized, request)
+
+
+@router.get("/{file_id}/export")
+async def export_file(
+    file_id: str,
+    request: Request,
+    format: Literal["parquet", "arrow", "csv"] = "parquet",
+    match: Literal["all", "any"] = "all",
+    columns: str | None = None,
+    service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
+):
+    file = await acl.require(
+        file_id, "read", f"You are not able to get data from file id {file_id}"
+    )
+    if file.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File with id {file_id} is {file.status}",
+        )
+    if format != "csv" and pa is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"Exporting {format} requires pyarrow",
+        )
+    column_types = await service.get_columns(file.id)
+    filters, sort = parse_table_query(request, list(column_types))
+    projection = parse_projection(columns, list(column_types))
+    batches = service.stream_batches(
+        file.id, filters=filters, match_all=match == "all", sort=sort, projection=projection
+    )
+    column_names = projection or list(column_types)
+    if format != "csv":
+        # A column typed from the upload sample may hold later values of another type.
+        column_types = await service.get_exact_types(file.id)
+    filename = f"{os.path.splitext(file.name)[0]}.{EXPORT_EXTENSIONS[format]}"
+    return StreamingResponse(
+        export_table(
+            batches, column_names, [column_types[name] for name in column_names], format
+        ),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": content_disposition(filename)},
+    )
+
+
+@router.get("/{file_id}/aggregate")
+async def aggregate_file(
+    file_id: str,
+    request: Request,
+    agg: list[str] = Query(["count"]),
+    group_by: str | None = None,
+    match: Literal["all", "any"] = "all",
+    limit: int | None = Query(None, ge=1),
+    service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
+):
+    file = await acl.require(
+        file_id, "read", f"You are not able to get data from file id {file_id}"
+    )
+    if file.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File with id {file_id} is {file.status}",
+        )
     column_names = file.column_order.split(",")
-    filters: dict[str, str] = {}
-    sort: dict[str, str] = {}
-    for key, value in request.query_params.items():
-        if key not in column_names:
-            continue
-        splitted_value = value.split(",")
-        filter_q = splitted_value[0]
-        sort_q = None
-        if len(splitted_value) > 1:
-            sort_q = splitted_value[1]
-        if filter_q:
-            filters[key] = filter_q
-        if sort_q and sort_q in ("asc", "desc"):
-            sort[key] = sort_q
-    data_db = await service.get_data(file_id, filters=filters)
-    data = defaultdict(list)
-    for item in data_db:
-        data[item.column_name].append(item.value)
-    if sort:
-        data = sort_table(data, sort)
-    return data
+    group_columns = group_by.split(",") if group_by else []
+    try:
+        aggregates = [parse_aggregate(query) for query in agg]
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    referenced = group_columns + [column_name for _, column_name in aggregates if column_name]
+    unknown = [column_name for column_name in referenced if column_name not in column_names]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown columns {','.join(unknown)}",
+        )
+    filters, _ = parse_table_query(request, column_names)
+    return await service.aggregate(
+        file.id,
+        aggregates,
+        group_by=group_columns,
+        filters=filters,
+        match_all=match == "all",
+        limit=limit,
+    )
 
 
-@router.put("/{file_id}/{username}")
-async def grant_file_access(
+@router.post("/{file_id}/rows")
+async def append_file_rows(
     file_id: str,
-    username: str,
-    user: User = Depends(get_current_user),
+    file: UploadFile,
+    service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
+):
+    db_file = await acl.require(
+        file_id, "owner", f"You are not the owner of file with id {file_id}"
+    )
+    if db_file.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File with id {file_id} is {db_file.status}",
+        )
+    if file.content_type != "text/csv":
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Wrong file type."
+        )
+    try:
+        processor = await asyncio.to_thread(CSVProcessor, file.file)
+        batches = await asyncio.to_thread(list, processor.batches)
+    except CSVValidationError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Wrong file type."
+        )
+    finally:
+        file.file.close()
+    column_names = db_file.column_order.split(",")
+    unknown = [name for name in processor.column_names if name not in column_names]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown columns {','.join(unknown)}",
+        )
+    start_row, row_count = await service.append_rows(
+        db_file.id, processor.column_names, batches
+    )
+    await service.commit()
+    return {"start_row": start_row, "rows_appended": row_count}
+
+
+@router.patch("/{file_id}/rows/{row_number}")
+async def update_file_row(
+    file_id: str,
+    row_number: int,
+    values: dict[str, str],
+    service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
+):
+    file = await acl.require(
+        file_id, "owner", f"You are not the owner of file with id {file_id}"
+    )
+    if file.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File with id {file_id} is {file.status}",
+        )
+    column_names = file.column_order.split(",")
+    unknown = [name for name in values if name not in column_names]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown columns {','.join(unknown)}",
+        )
+    updated = await service.update_row(file.id, row_number, values)
+    if not updated:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Row {row_number} of file with id {file_id} not found",
+        )
+    await service.commit()
+    return Response("Success")
+
+
+@router.patch("/{file_id}/columns/{column_name}")
+async def rename_file_column(
+    file_id: str,
+    column_name: str,
+    name: str,
     service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
 ):
-    file = await service.get_file(UUID(file_id))
-    if not file:
+    file = await acl.require(
+        file_id, "owner", f"You are not the owner of file with id {file_id}"
+    )
+    if file.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"File with id {file_id} is {file.status}",
+        )
+    column_names = file.column_order.split(",")
+    if column_name not in column_names:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"File with UUID {file_id} not found",
+            detail=f"Column {column_name} of file with id {file_id} not found",
         )
-    if file.owner_id != user.id:
+    if not name or "," in name or name in column_names:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"You are not able to edit permissions for file id {file_id}",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid column name {name}",
         )
+    await service.rename_column(file.id, column_name, name)
+    await service.commit()
+    return Response("Success")
+
+
+@router.put("/{file_id}/{username}")
+async def grant_file_access(
+    file_id: str,
+    username: str,
+    service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
+):
+    file = await acl.require(
+        file_id, "owner", f"You are not able to edit permissions for file id {file_id}"
+    )
     access_user = await service.get_user(username)
     if not access_user:
         raise HTTPException(
@@ -167,20 +454,12 @@ async def grant_file_access(
 async def grant_file_access(
     file_id: str,
     username: str,
-    user: User = Depends(get_current_user),
     service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
 ):
-    file = await service.get_file(UUID(file_id))
-    if not file:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"File with UUID {file_id} not found",
-        )
-    if file.owner_id != user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"You are not able to edit permissions for file id {file_id}",
-        )
+    file = await acl.require(
+        file_id, "owner", f"You are not able to edit permissions for file id {file_id}"
+    )
     access_user = await service.get_user(username)
     if not access_user:
         raise HTTPException(
@@ -196,20 +475,12 @@ async def grant_file_access(
 @router.get("/{file_id}/access")
 async def get_file_access(
     file_id: str,
-    user: User = Depends(get_current_user),
     service: DatabaseService = Depends(get_db_service),
+    acl: FileACL = Depends(FileACL),
 ):
-    file = await service.get_file(UUID(file_id))
-    if not file:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"File with UUID {file_id} not found",
-        )
-    if file.owner_id != user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"You are not able to get data from file id {file_id}",
-        )
+    file = await acl.require(
+        file_id, "owner", f"You are not able to get data from file id {file_id}"
+    )
     file_access_db:list[UUID, UUID, str] = await service.get_file_access(file.id)
     file_access = []
     for access in file_access_db:
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from ..database import pool_status
+from ..models import PoolStatus
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/pool", response_model=PoolStatus)
+async def get_pool_status():
+    return PoolStatus(**pool_status())
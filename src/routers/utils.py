@@ -1,12 +1,33 @@
-from fastapi import Depends, HTTPException, status
+import base64
+import binascii
+import csv
+import io
+import json
+import time
+from typing import AsyncIterator
+from uuid import UUID
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse
+from src.auth.cache import AUTH_CACHE_TTL, auth_cache, token_key, user_key
 from src.auth.jwt import decode_access_token
 from src.database import get_db_service
 
+from ..cache import Materialized, etag_matches
+from ..database.models import File as DBFile
 from ..database.service import DatabaseService
+from ..database.sorting import parse_sort
 from ..errors import TokenExpiredException
 from ..models import User
 from .auth import oauth2_scheme
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DefaultJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+FILE_PERMISSIONS = {"read": ("read", "owner"), "owner": ("owner",)}
+
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -17,37 +38,169 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = decode_access_token(token)
-    except TokenExpiredException:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    username: str = payload.get("sub")
+    username = await auth_cache.get(token_key(token))
     if username is None:
-        raise credentials_exception
+        try:
+            payload = decode_access_token(token)
+        except TokenExpiredException:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+        ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+        if ttl > 0:
+            await auth_cache.set(token_key(token), username, ttl=ttl)
 
+    user = await auth_cache.get(user_key(username))
+    if user is not None:
+        return user
     user_db = await service.get_user(username)
 
     if user_db:
-        return User.model_validate(user_db)
+        user = User.model_validate(user_db)
+        await auth_cache.set(user_key(username), user)
+        return user
     raise credentials_exception
 
 
-def sort_table(table: dict[str, list], sort_order: dict[str, str]) -> dict[str, list]:
-    rows = [dict(zip(table, row)) for row in zip(*table.values())]
+def is_valid_sort(sort_query: str) -> bool:
+    try:
+        parse_sort(sort_query)
+    except ValueError:
+        return False
+    return True
+
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "json": "application/json",
+}
+
+
+async def stream_table(
+    rows: AsyncIterator[list[str]],
+    column_names: list[str],
+    stream_format: str,
+    chunk_rows: int = 500,
+) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if stream_format == "csv":
+        writer.writerow(column_names)
+    elif stream_format == "json":
+        buffer.write(f'{{"columns": {json.dumps(column_names)}, "rows": [')
+    row_count = 0
+    async for row in rows:
+        if stream_format == "csv":
+            writer.writerow(row)
+        elif stream_format == "json":
+            buffer.write(("," if row_count else "") + json.dumps(row))
+        else:
+            buffer.write(json.dumps(dict(zip(column_names, row))) + "\n")
+        row_count += 1
+        if row_count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if stream_format == "json":
+        buffer.write("]}")
+    yield buffer.getvalue()
+
 
-    def sort_key(row):
-        return tuple(
-            row[column] if order == "asc" else -row[column]
-            for column, order in sort_order.items()
+def parse_table_query(request: Request, column_names: list[str]) -> tuple[dict, dict]:
+    filters: dict[str, str] = {}
+    sort: dict[str, str] = {}
+    for key, value in request.query_params.items():
+        if key not in column_names:
+            continue
+        splitted_value = value.split(",")
+        filter_q = splitted_value[0]
+        sort_q = None
+        if len(splitted_value) > 1:
+            sort_q = splitted_value[1]
+        if filter_q:
+            filters[key] = filter_q
+        if sort_q and is_valid_sort(sort_q):
+            sort[key] = sort_q
+    return filters, sort
+
+
+def parse_projection(columns: str | None, column_names: list[str]) -> list[str] | None:
+    if not columns:
+        return None
+    projection = list(dict.fromkeys(name for name in columns.split(",") if name))
+    unknown = [name for name in projection if name not in column_names]
+    if unknown or not projection:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown columns {','.join(unknown)}",
         )
+    return projection
 
-    sorted_rows = sorted(rows, key=sort_key)
-    sorted_table = {column: [] for column in table.keys()}
-    for row in sorted_rows:
-        for column, value in row.items():
-            sorted_table[column].append(value)
-    return sorted_table
+
+def encode_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        key = None
+    if not isinstance(key, list) or not key:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor",
+        )
+    return key
+
+
+class FileACL:
+    def __init__(
+        self,
+        user: User = Depends(get_current_user),
+        service: DatabaseService = Depends(get_db_service),
+    ) -> None:
+        self.user = user
+        self.service = service
+        self.permissions: dict[UUID, tuple[DBFile | None, str | None]] = {}
+
+    async def get(self, file_id: UUID) -> tuple[DBFile | None, str | None]:
+        if file_id not in self.permissions:
+            self.permissions[file_id] = await self.service.get_file_permission(
+                file_id, self.user.id
+            )
+        return self.permissions[file_id]
+
+    async def require(self, file_id: str, permission: str, forbidden_detail: str) -> DBFile:
+        try:
+            file, granted = await self.get(UUID(file_id))
+        except ValueError:
+            file, granted = None, None
+        if not file:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"File with id {file_id} not found",
+            )
+        if granted not in FILE_PERMISSIONS[permission]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=forbidden_detail,
+            )
+        return file
+
+
+def materialized_response(materialized: Materialized, request: Request) -> Response:
+    if etag_matches(request.headers.get("if-none-match"), materialized.etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": materialized.etag, **materialized.headers},
+        )
+    accept_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    body, headers = materialized.content(accept_gzip)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+import gzip
+import uuid
+from src.cache import (
+    LocalCache,
+    Materialized,
+    etag_matches,
+    materialized_key,
+    serialize,
+)
+
+
+class TestLocalCache:
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        cache = LocalCache(maxsize=2)
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        assert await cache.get("a") == 1
+        await cache.set("c", 3)
+        assert await cache.get("b") is None
+        assert await cache.get("a") == 1
+        assert await cache.get("c") == 3
+
+    @pytest.mark.asyncio
+    async def test_ttl(self):
+        cache = LocalCache(ttl=0.05)
+        await cache.set("a", 1)
+        await cache.set("b", 2, ttl=10)
+        assert await cache.get("a") == 1
+        await asyncio.sleep(0.06)
+        assert await cache.get("a") is None
+        assert await cache.get("b") == 2
+
+    @pytest.mark.asyncio
+    async def test_delete(self):
+        cache = LocalCache()
+        await cache.set("a", 1)
+        await cache.delete("a")
+        await cache.delete("missing")
+        assert await cache.get("a") is None
+        await cache.set("b", 2)
+        await cache.clear()
+        assert await cache.get("b") is None
+
+    @pytest.mark.asyncio
+    async def test_maxbytes(self):
+        cache = LocalCache(maxbytes=10)
+        await cache.set("a", b"12345")
+        await cache.set("b", b"1234")
+        assert await cache.get("a") == b"12345"
+        await cache.set("c", b"123")
+        assert await cache.get("b") is None
+        assert cache.nbytes == 8
+        await cache.set("d", b"12345678901")
+        assert await cache.get("d") is None
+        await cache.delete("a")
+        assert cache.nbytes == 3
+
+
+class TestMaterialized:
+    def test_content(self):
+        body = serialize({"a": ["x" * 2000], "b": ["é"]})
+        materialized = Materialized(body, {"X-Next-Cursor": "abc"})
+        assert materialized.compressed
+        assert len(materialized) < len(body)
+        content, headers = materialized.content(accept_gzip=True)
+        assert gzip.decompress(content) == body
+        assert headers["Content-Encoding"] == "gzip"
+        assert headers["X-Next-Cursor"] == "abc"
+        content, headers = materialized.content(accept_gzip=False)
+        assert content == body
+        assert "Content-Encoding" not in headers
+        assert headers["ETag"] == materialized.etag
+        assert Materialized(body).etag == materialized.etag
+
+    def test_etag_matches(self):
+        etag = Materialized(b"{}").etag
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+
+    def test_materialized_key(self):
+        file_id = uuid.uuid4()
+        key = materialized_key(file_id, 0, ("all",))
+        assert materialized_key(file_id, 0, ("all",)) == key
+        assert materialized_key(file_id, 1, ("all",)) != key
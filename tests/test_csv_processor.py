@@ -0,0 +1,102 @@
+import csv
+import io
+from datetime import date
+import pytest
+from src.csv_processor import CSVProcessor, convert_value, infer_type, parse_chunk, record_chunks
+
+
+@pytest.mark.parametrize(
+    "values, column_type",
+    [
+        (["1", "-2", ""], "int"),
+        (["1", "2.5", "1e3"], "float"),
+        (["yes", "No", "TRUE"], "bool"),
+        (["2023-01-01", "", "2023-12-31"], "date"),
+        (["1", "x"], "text"),
+        (["2023-01-01", "1"], "text"),
+        (["", ""], "text"),
+    ],
+)
+def test_infer_type(values, column_type):
+    assert infer_type(values) == column_type
+
+
+@pytest.mark.parametrize(
+    "value, column_type, converted",
+    [
+        ("12", "int", 12.0),
+        (" 1.5 ", "float", 1.5),
+        ("1.5", "int", None),
+        ("no", "bool", 0.0),
+        ("2023-02-03", "date", date(2023, 2, 3)),
+        ("2023-02-30", "date", None),
+        ("x", "text", None),
+    ],
+)
+def test_convert_value(value, column_type, converted):
+    assert convert_value(value, column_type) == converted
+
+
+def test_processor_column_types():
+    file = io.BytesIO(b"id;name;price;day\n1;a;1.5;2023-01-01\n2;b;2;2023-01-02\n3;c;x;2023-01-03\n")
+    processor = CSVProcessor(file, sample_rows=2)
+    assert processor.column_types == {"id": "int", "name": "text", "price": "float", "day": "date"}
+    assert [row["id"] for row in processor] == ["1", "2", "3"]
+
+
+@pytest.mark.parametrize("engine", ["python", "pyarrow"])
+def test_processor_batches(engine):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    file = io.BytesIO(b'a,b\n1,"x, y"\n2,\n\n3,z\n4,w\n5,v\n')
+    processor = CSVProcessor(file, sample_rows=2, batch_size=2, engine=engine)
+    assert processor.column_names == ["a", "b"]
+    assert processor.column_types == {"a": "int", "b": "text"}
+    assert list(processor.batches) == [
+        [["1", "x, y"], ["2", ""]],
+        [["3", "z"], ["4", "w"]],
+        [["5", "v"]],
+    ]
+
+
+def test_record_chunks(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_bytes(b'a,b\n1,"x\ny"\n2,"say ""hi""\n"\n3,z\n')
+    chunks = list(record_chunks(str(path), chunk_bytes=5))
+    assert chunks == [(0, 12), (12, 28), (28, 32)]
+    dialect = {"delimiter": ",", "quotechar": '"'}
+    rows = [
+        row
+        for start, end in chunks
+        for row in parse_chunk(str(path), start, end, dialect, 2, skip_header=start == 0)
+    ]
+    assert rows == [["1", "x\ny"], ["2", 'say "hi"\n'], ["3", "z"]]
+
+
+def test_record_chunks_unquoted_quotes(tmp_path):
+    # A quote inside an unquoted field is a plain character, not an opening quote.
+    text = "a,b,c\n" + "".join(
+        f'{i},5" pipe,ok\n' if i == 3 else f'{i},x,"multi\nline {i}"\n' for i in range(60)
+    )
+    path = tmp_path / "upload.csv"
+    path.write_text(text)
+    dialect = {"delimiter": ",", "quotechar": '"'}
+    rows = [
+        row
+        for start, end in record_chunks(str(path), chunk_bytes=40)
+        for row in parse_chunk(str(path), start, end, dialect, 3, skip_header=start == 0)
+    ]
+    assert rows == list(csv.reader(io.StringIO(text, newline="")))[1:]
+    assert ["30", "x", "multi\nline 30"] in rows
+
+
+@pytest.mark.parametrize("engine", ["python", "pyarrow"])
+def test_processor_ragged_rows(engine):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    file = io.BytesIO(b'a,b\n1,"x\ny"\n2\n3,z,extra\n4,"say ""hi"""\n')
+    processor = CSVProcessor(file, sample_rows=1, batch_size=2, engine=engine)
+    assert list(processor.batches) == [
+        [["1", "x\ny"], ["2", ""]],
+        [["3", "z"], ["4", 'say "hi"']],
+    ]
@@ -2,7 +2,9 @@ from collections import defaultdict
 import pprint
 import pytest
 import pytest_asyncio
-from src.database import reset_models, test_db_service
+from src.auth.cache import auth_cache, user_key
+from src.database import DatabaseService, reset_models, test_db_service
+from src.errors import InvalidCursor
 from contextlib import nullcontext
 
 from sqlalchemy.exc import IntegrityError, DBAPIError
@@ -28,7 +30,8 @@ async def user():
 async def file():
     async with test_db_service() as service:
         user = await service.create_user("user", "password")
-        file = await service.create_file("file1", user.id, "a,b,c")
+        await service.session.flush()
+        file = await service.create_file("file1", user.id, ["a", "b", "c"])
         await service.commit()
         yield file
         await service.delete_user(user.id)
@@ -61,9 +64,9 @@ class TestDatabaseService:
     @pytest.mark.parametrize(
         "filename, columns_order, context",
         [
-            ("file1", "a,b,c", nullcontext()),
-            (1, "a,b,c", pytest.raises(DBAPIError)),
-            ("file1", 1, pytest.raises(DBAPIError)),
+            ("file1", ["a", "b", "c"], nullcontext()),
+            (1, ["a", "b", "c"], pytest.raises(DBAPIError)),
+            ("file1", 1, pytest.raises(TypeError)),
         ],
     )
     async def test_create_file_user(self, filename, columns_order, context, user):
@@ -79,7 +82,7 @@ class TestDatabaseService:
     async def test_create_file_nouser(self):
         async with test_db_service() as service:
             with pytest.raises(IntegrityError):
-                file = await service.create_file("file1", uuid4(), "a,b,c")
+                file = await service.create_file("file1", uuid4(), ["a", "b", "c"])
                 await service.commit()
 
     @pytest.mark.asyncio
@@ -125,3 +128,429 @@ class TestDatabaseService:
             assert files[0].id == file.id
             has_access = await service.has_access(file.id, user.id)
             assert has_access is True
+
+    @pytest.mark.asyncio
+    async def test_file_permission(self, file, user):
+        async with test_db_service() as service:
+            db_file, permission = await service.get_file_permission(file.id, file.owner_id)
+            assert db_file.id == file.id
+            assert permission == "owner"
+            db_file, permission = await service.get_file_permission(file.id, user.id)
+            assert db_file.id == file.id
+            assert permission is None
+            await service.create_file_access(file.id, user.id)
+            await service.commit()
+            _, permission = await service.get_file_permission(file.id, user.id)
+            assert permission == "read"
+            missing = await service.get_file_permission(uuid4(), user.id)
+            assert missing == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_bulk_create_data(self, file):
+        async with test_db_service() as service:
+            rows = [{"a": str(i), "b": f"b{i}", "c": ""} for i in range(25)]
+            row_count = await service.bulk_create_data(file.id, iter(rows), batch_size=10)
+            await service.commit()
+            assert row_count == 25
+            data = await service.get_data(file.id)
+            got_data = defaultdict(list)
+            for item in data:
+                got_data[item.column_name].append((item.row_number, item.value))
+            for column in ("a", "b", "c"):
+                assert sorted(got_data[column]) == [(i, row[column]) for i, row in enumerate(rows)]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    async def test_record_layout(self, file):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout="row")
+            rows = [
+                {"a": "x", "b": "y", "c": "z"},
+                {"a": "a", "b": "b", "c": "c"},
+                {"a": "x", "b": "f", "c": "h"},
+            ]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+            data = await service.get_data(file.id, {"a": "x"})
+            got_data = defaultdict(list)
+            for item in data:
+                got_data[item.column_name].append(item.value)
+            assert got_data == {"a": ["x", "x"], "b": ["y", "f"], "c": ["z", "h"]}
+            assert await service.convert_file_layout(file.id, "cell") == 9
+            await service.commit()
+            cell_service = DatabaseService(service.session, layout="cell")
+            data = await cell_service.get_data(file.id, {"b": "b"})
+            assert sorted((item.column_name, item.value) for item in data) == [
+                ("a", "a"), ("b", "b"), ("c", "c")
+            ]
+            assert await cell_service.convert_file_layout(file.id, "row") == 3
+            await service.commit()
+            assert len(await service.get_data(file.id)) == 9
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_column_values(self, file, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            rows = [
+                {"a": "x", "b": "y", "c": "z"},
+                {"a": "a", "b": "b", "c": "c"},
+                {"a": "x", "b": "f", "c": ""},
+            ]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+            assert await service.get_column_values(file.id) == {
+                "a": ["x", "a", "x"], "b": ["y", "b", "f"], "c": ["z", "c", ""]
+            }
+            assert await service.get_column_values(
+                file.id, {"a": "=x"}, sort={"b": "asc"}, projection=["c", "b"]
+            ) == {"c": ["", "z"], "b": ["f", "y"]}
+            assert await service.get_column_values(file.id, {"a": "=nothing"}) == {}
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    async def test_explain_data(self, file):
+        async with test_db_service() as service:
+            report = await service.explain_data(file.id, {"a": "x"})
+            assert report["plan"]["Node Type"]
+            assert report["uses_index"] == (bool(report["indexes"]) and not report["seq_scans"])
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    @pytest.mark.parametrize(
+        "filters, match_all, expected_a",
+        [
+            ({"a": "x"}, True, ["x", "xy", "ax"]),
+            ({"a": "=x"}, True, ["x"]),
+            ({"a": "^x"}, True, ["x", "xy"]),
+            ({"a": "~x", "b": "=2"}, True, ["xy"]),
+            ({"a": "=ax", "b": "=1"}, False, ["x", "ax"]),
+            ({"a": "=x", "unknown": "1"}, True, []),
+        ],
+    )
+    async def test_data_filters(self, file, layout, filters, match_all, expected_a):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            rows = [
+                {"a": "x", "b": "1", "c": ""},
+                {"a": "xy", "b": "2", "c": ""},
+                {"a": "ax", "b": "3", "c": ""},
+                {"a": "b", "b": "4", "c": ""},
+            ]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+            data = await service.get_data(file.id, filters, match_all=match_all)
+            assert [item.value for item in data if item.column_name == "a"] == expected_a
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_stream_data(self, file, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            rows = [{"a": str(i), "b": f"b{i}", "c": "x" if i % 2 else "y"} for i in range(7)]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+            streamed = [row async for row in service.stream_data(file.id, batch_size=3)]
+            assert streamed == [list(row.values()) for row in rows]
+            streamed = [row async for row in service.stream_data(file.id, {"c": "=x"})]
+            assert streamed == [list(row.values()) for row in rows[1::2]]
+            streamed = [
+                row async for row in service.stream_data(file.id, {"c": "=x"}, projection=["c", "a"])
+            ]
+            assert streamed == [["x", row["a"]] for row in rows[1::2]]
+            data = await service.get_data(file.id, sort={"a": "desc"}, projection=["b"])
+            assert [(item.column_name, item.value) for item in data] == [
+                ("b", row["b"]) for row in reversed(rows)
+            ]
+            batches = [batch async for batch in service.stream_batches(file.id, batch_size=3)]
+            assert [len(batch) for batch in batches] == [3, 3, 1]
+            assert sum(batches, []) == [list(row.values()) for row in rows]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_row_keys(self, file, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            rows = [{"a": str(i), "b": "x" if i % 3 else "y", "c": ""} for i in range(10)]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+            assert await service.get_row_keys(file.id, limit=4) == [(0,), (1,), (2,), (3,)]
+            assert await service.get_row_keys(file.id, limit=4, after=[7]) == [(8,), (9,)]
+            for after in (["abc"], [{"x": 1}], [True]):
+                with pytest.raises(InvalidCursor):
+                    await service.get_row_keys(file.id, limit=4, after=after)
+            with pytest.raises(InvalidCursor):
+                await service.get_row_keys(file.id, sort={"b": "asc"}, limit=4, after=[1, 2])
+            page = await service.get_row_keys(file.id, {"b": "=x"}, limit=3, after=[2])
+            assert page == [(4,), (5,), (7,)]
+            data = await service.get_data(file.id, row_numbers=[key[-1] for key in page])
+            assert [item.value for item in data if item.column_name == "a"] == ["4", "5", "7"]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_data_sort(self, file, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            rows = [
+                {"a": "10", "b": "x", "c": "2023-01-02"},
+                {"a": "9", "b": "y", "c": "2023-01-01"},
+                {"a": "", "b": "x", "c": "2022-12-31"},
+                {"a": "100", "b": "y", "c": ""},
+            ]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+
+            async def sorted_column(column, sort, **kwargs):
+                data = await service.get_data(file.id, sort=sort, **kwargs)
+                return [item.value for item in data if item.column_name == column]
+
+            assert await sorted_column("a", {"a": "asc"}) == ["", "10", "100", "9"]
+            assert await sorted_column("a", {"a": "asc:numeric"}) == ["9", "10", "100", ""]
+            assert await sorted_column("a", {"b": "desc", "a": "desc:numeric"}) == ["100", "9", "10", ""]
+            assert await sorted_column("c", {"c": "desc:date"}) == [
+                "2023-01-02", "2023-01-01", "2022-12-31", ""
+            ]
+            assert await sorted_column("a", {"a": "asc:numeric"}, filters={"b": "=x"}) == ["10", ""]
+            sort = {"b": "asc", "a": "desc:numeric"}
+            first_page = await service.get_row_keys(file.id, sort=sort, limit=2)
+            assert first_page == [("x", 10.0, 0), ("x", None, 2)]
+            second_page = await service.get_row_keys(file.id, sort=sort, limit=2, after=list(first_page[-1]))
+            assert second_page == [("y", 100.0, 3), ("y", 9.0, 1)]
+            data = await service.get_data(file.id, row_numbers=[key[-1] for key in second_page])
+            assert [item.value for item in data if item.column_name == "a"] == ["100", "9"]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_data_sort_unparsed_values(self, file, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            rows = [
+                {"a": "1e999", "b": "x", "c": "2023-02-30"},
+                {"a": "5", "b": "x", "c": "2023-13-01"},
+                {"a": "x", "b": "x", "c": "2023-01-015"},
+                {"a": "1e-999", "b": "x", "c": "2024-02-29"},
+                {"a": "-1e999", "b": "x", "c": "2023-01-01"},
+            ]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+
+            async def sorted_column(column, sort):
+                data = await service.get_data(file.id, sort=sort)
+                return [item.value for item in data if item.column_name == column]
+
+            assert await sorted_column("c", {"c": "asc:date"}) == [
+                "2023-01-01", "2024-02-29", "2023-02-30", "2023-13-01", "2023-01-015"
+            ]
+            assert await sorted_column("a", {"a": "asc:numeric"}) == [
+                "-1e999", "1e-999", "5", "1e999", "x"
+            ]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_typed_data(self, user, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            column_types = {"n": "int", "d": "date", "f": "bool"}
+            file = await service.create_file("typed", user.id, ["n", "d", "f"], ["int", "date", "bool"])
+            await service.commit()
+            rows = [
+                {"n": "10", "d": "2023-01-02", "f": "yes"},
+                {"n": "9", "d": "2023-01-01", "f": "no"},
+                {"n": "", "d": "", "f": ""},
+                {"n": "100", "d": "2022-12-31", "f": "true"},
+            ]
+            await service.bulk_create_data(file.id, rows, column_types=column_types)
+            await service.commit()
+
+            async def column(name, **kwargs):
+                data = await service.get_data(file.id, **kwargs)
+                return [item.value for item in data if item.column_name == name]
+
+            assert await column("n", sort={"n": "asc"}) == ["9", "10", "100", ""]
+            assert await column("n", sort={"n": "asc:text"}) == ["", "10", "100", "9"]
+            assert await column("n", filters={"n": ">9"}) == ["10", "100"]
+            assert await column("n", filters={"n": "9..10"}) == ["10", "9"]
+            assert await column("n", filters={"n": "<x"}) == []
+            assert await column("d", filters={"d": "..2023-01-01"}, sort={"d": "asc"}) == [
+                "2022-12-31", "2023-01-01"
+            ]
+            assert await column("f", filters={"f": ">=1"}) == ["yes", "true"]
+            assert await service.get_exact_types(file.id) == column_types
+            await service.append_rows(file.id, ["n", "d"], [[["99999999999999999999", "2023-02-30"]]])
+            await service.commit()
+            assert await service.get_exact_types(file.id) == {"n": "text", "d": "text", "f": "bool"}
+            await service.append_rows(file.id, ["n", "f"], [[["1.5", "maybe"]]])
+            await service.commit()
+            assert await service.get_exact_types(file.id) == {"n": "text", "d": "text", "f": "text"}
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_search(self, file, user, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            own_file = await service.create_file("own", user.id, ["a", "b"])
+            await service.commit()
+            await service.bulk_create_data(
+                own_file.id, [{"a": "red apple", "b": "1"}, {"a": "green pear", "b": "2"}]
+            )
+            await service.bulk_create_data(file.id, [{"a": "apple", "b": "", "c": ""}])
+            await service.commit()
+            results = await service.search(user.id, "apple")
+            assert [(file_id, row_number) for file_id, _, row_number, _ in results] == [
+                (own_file.id, 0)
+            ]
+            assert results[0][1] == "own"
+            assert await service.search(user.id, "pea") != []
+            assert await service.search(user.id, "banana") == []
+            await service.create_file_access(file.id, user.id)
+            await service.commit()
+            assert len(await service.search(user.id, "apple", limit=1)) == 1
+            results = await service.search(user.id, "apple")
+            assert {file_id for file_id, *_ in results} == {own_file.id, file.id}
+            assert await service.index_search_documents(own_file.id) == 2
+            assert len(await service.search(user.id, "apple")) == 2
+            assert await service.delete_file(own_file.id) is True
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_append_and_update_rows(self, user, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            file = await service.create_file("grow", user.id, ["n", "s"], ["int", "text"])
+            await service.commit()
+            column_types = {"n": "int", "s": "text"}
+            await service.bulk_create_data(file.id, [{"n": "1", "s": "a"}], column_types=column_types)
+            await service.commit()
+            start_row, row_count = await service.append_rows(
+                file.id, ["s", "n"], [[["b", "2"], ["c", "3"]], [["d", "4"]]]
+            )
+            await service.commit()
+            assert (start_row, row_count) == (1, 3)
+            start_row, _ = await service.append_rows(file.id, ["s"], [[["e"]]])
+            await service.commit()
+            assert start_row == 4
+            rows = [row async for row in service.stream_data(file.id)]
+            assert rows == [["1", "a"], ["2", "b"], ["3", "c"], ["4", "d"], ["", "e"]]
+            assert await service.update_row(file.id, 2, {"n": "30"}) is True
+            assert await service.update_row(file.id, 9, {"n": "1"}) is False
+            await service.commit()
+            rows = [row async for row in service.stream_data(file.id, {"n": ">10"})]
+            assert rows == [["30", "c"]]
+            results = await service.search(user.id, "30")
+            assert [row_number for _, _, row_number, _ in results] == [2]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_rename_column(self, user, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            file = await service.create_file("columns", user.id, ["n", "s"], ["int", "text"])
+            await service.commit()
+            rows = [{"n": "1", "s": "a"}, {"n": "2", "s": "b"}]
+            await service.bulk_create_data(file.id, rows, column_types={"n": "int", "s": "text"})
+            await service.commit()
+            await service.session.refresh(file)
+            version = file.version
+            assert await service.rename_column(file.id, "n", "number") is True
+            assert await service.rename_column(file.id, "missing", "x") is False
+            await service.commit()
+            await service.session.refresh(file)
+            assert file.version == version + 1
+            assert await service.get_columns(file.id) == {"number": "int", "s": "text"}
+            assert (await service.get_file(file.id)).column_order == "number,s"
+            values = await service.get_column_values(file.id, {"number": ">1"})
+            assert values == {"number": ["2"], "s": ["b"]}
+            data = await service.get_data(file.id, projection=["number"])
+            assert [(item.column_name, item.value) for item in data] == [("number", "1"), ("number", "2")]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_soft_delete_and_purge(self, user, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            file = await service.create_file("purge", user.id, ["a", "b", "c"])
+            await service.commit()
+            rows = [{"a": str(i), "b": "", "c": ""} for i in range(5)]
+            await service.bulk_create_data(file.id, rows)
+            await service.commit()
+            assert await service.delete_file(file.id) is True
+            assert await service.delete_file(file.id) is False
+            await service.commit()
+            assert await service.get_files(user.id) == []
+            assert await service.get_file_permission(file.id, user.id) == (None, None)
+            assert file.id in await service.get_deleted_files()
+            assert await service.set_file_status(file.id, "ready") is False
+            deleted = []
+            while step := await service.purge_file(file.id, batch_size=4):
+                deleted.append(step)
+                await service.commit()
+            cells = 5 if layout == "row" else 15
+            columns = 3
+            assert sum(deleted) == cells + 5 + columns + 1
+            assert max(deleted) <= 4
+            assert await service.get_file(file.id) is None
+            assert file.id not in await service.get_deleted_files()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("layout", ["cell", "row"])
+    async def test_aggregate(self, user, layout):
+        async with test_db_service() as service:
+            service = DatabaseService(service.session, layout=layout)
+            column_types = {"g": "text", "n": "int", "d": "date"}
+            file = await service.create_file("agg", user.id, ["g", "n", "d"], ["text", "int", "date"])
+            await service.commit()
+            rows = [
+                {"g": "x", "n": "1", "d": "2023-01-02"},
+                {"g": "y", "n": "2", "d": "2023-01-01"},
+                {"g": "x", "n": "3", "d": ""},
+                {"g": "x", "n": "", "d": "2022-12-31"},
+            ]
+            await service.bulk_create_data(file.id, rows, column_types=column_types)
+            await service.commit()
+            aggregates = [("count", None), ("sum", "n"), ("avg", "n"), ("count", "n"), ("min", "d")]
+            result = await service.aggregate(file.id, aggregates, group_by=["g"])
+            assert [row["g"] for row in result] == ["x", "y"]
+            assert [row["count"] for row in result] == [3, 1]
+            assert [row["sum_n"] for row in result] == [4.0, 2.0]
+            assert [row["avg_n"] for row in result] == [2.0, 2.0]
+            assert [row["count_n"] for row in result] == [2, 1]
+            assert str(result[0]["min_d"]) == "2022-12-31"
+            result = await service.aggregate(
+                file.id, [("distinct", "g"), ("max", "n")], filters={"n": "<3"}
+            )
+            assert result == [{"distinct_g": 2, "max_n": 2.0}]
+            assert await service.delete_file(file.id) is True
+            await service.commit()
+
+    @pytest.mark.asyncio
+    async def test_delete_user_invalidates_auth_cache(self):
+        async with test_db_service() as service:
+            user = await service.create_user(f"user_{uuid4()}", "password")
+            await service.commit()
+            await auth_cache.set(user_key(user.username), user)
+            assert await service.delete_user(user.id) is True
+            await service.commit()
+            assert await auth_cache.get(user_key(user.username)) is None
+            assert await service.delete_user(user.id) is False
@@ -0,0 +1,100 @@
+import io
+import pytest
+from src.errors import ExportConversionError
+from src.export import content_disposition, export_table
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pa_parquet
+
+COLUMN_NAMES = ["id", "price", "active", "day", "name"]
+COLUMN_TYPES = ["int", "float", "bool", "date", "text"]
+# The types DatabaseService.get_exact_types reports for these rows.
+EXACT_TYPES = ["text", "float", "text", "text", "text"]
+
+
+async def batches():
+    yield [["1", "1.5", "yes", "2020-01-02", "a,b"], ["2", "", "no", "2020-01-03", ""]]
+    yield [["x", "2", "maybe", "never", 'say "hi"']]
+
+
+async def export(export_format: str, column_types: list[str] = EXACT_TYPES) -> tuple[int, bytes]:
+    chunks = [chunk async for chunk in export_table(batches(), COLUMN_NAMES, column_types, export_format)]
+    return len(chunks), b"".join(chunks)
+
+
+class TestExport:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+    async def test_columnar(self, export_format):
+        chunk_count, data = await export(export_format)
+        assert chunk_count > 1
+        if export_format == "parquet":
+            table = pa_parquet.read_table(io.BytesIO(data))
+        else:
+            table = pa_ipc.open_stream(data).read_all()
+        assert table.schema.names == COLUMN_NAMES
+        assert str(table.schema.field("price").type) == "double"
+        columns = table.to_pydict()
+        assert columns["id"] == ["1", "2", "x"]
+        assert columns["price"] == [1.5, None, 2.0]
+        assert columns["active"] == ["yes", "no", "maybe"]
+        assert columns["day"] == ["2020-01-02", "2020-01-03", "never"]
+        assert columns["name"] == ["a,b", "", 'say "hi"']
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+    async def test_typed_columns(self, export_format):
+        async def typed_batches():
+            yield [["1", "1.5", "yes", "2020-01-02", "a"], ["2", "", "no", "", ""]]
+
+        chunks = [
+            chunk
+            async for chunk in export_table(typed_batches(), COLUMN_NAMES, COLUMN_TYPES, export_format)
+        ]
+        data = b"".join(chunks)
+        if export_format == "parquet":
+            table = pa_parquet.read_table(io.BytesIO(data))
+        else:
+            table = pa_ipc.open_stream(data).read_all()
+        assert str(table.schema.field("day").type) == "date32[day]"
+        columns = table.to_pydict()
+        assert columns["id"] == [1, 2]
+        assert columns["active"] == [True, False]
+        assert columns["day"][1] is None
+
+    @pytest.mark.asyncio
+    async def test_unconverted_value(self):
+        with pytest.raises(ExportConversionError):
+            await export("parquet", COLUMN_TYPES)
+
+    @pytest.mark.asyncio
+    async def test_int64(self):
+        async def export_int(value):
+            async def int_batches():
+                yield [[value]]
+
+            chunks = [chunk async for chunk in export_table(int_batches(), ["n"], ["int"], "arrow")]
+            return pa_ipc.open_stream(b"".join(chunks)).read_all().to_pydict()["n"]
+
+        assert await export_int("9007199254740993") == [9007199254740993]
+        with pytest.raises(ExportConversionError):
+            await export_int("99999999999999999999")
+
+    def test_content_disposition(self):
+        header = content_disposition('данные "1".parquet')
+        header.encode("latin-1")
+        assert header == (
+            'attachment; filename="______ _1_.parquet"; '
+            "filename*=UTF-8''%D0%B4%D0%B0%D0%BD%D0%BD%D1%8B%D0%B5%20%221%22.parquet"
+        )
+
+    @pytest.mark.asyncio
+    async def test_csv(self):
+        _, data = await export("csv")
+        assert data.decode().splitlines() == [
+            "id,price,active,day,name",
+            '1,1.5,yes,2020-01-02,"a,b"',
+            "2,,no,2020-01-03,",
+            'x,2,maybe,never,"say ""hi"""',
+        ]
@@ -0,0 +1,126 @@
+import io
+import os
+import time
+from uuid import uuid4
+import pytest
+import pytest_asyncio
+from src.database import reset_models, test_db_service as db_service
+from src.ingest import INGEST_OWNER, IngestJob, IngestQueue, spool_upload
+
+
+@pytest_asyncio.fixture(scope="module", autouse=True)
+async def reset_db():
+    await reset_models()
+
+
+@pytest_asyncio.fixture
+async def file():
+    async with db_service() as service:
+        user = await service.create_user(f"user_{uuid4()}", "password")
+        file = await service.create_file(
+            "file.csv",
+            user.id,
+            ["a", "b"],
+            ["int", "text"],
+            status="processing",
+            ingest_owner=INGEST_OWNER,
+        )
+        await service.commit()
+        yield file
+        await service.delete_file(file.id)
+        await service.delete_user(user.id)
+        await service.commit()
+
+
+class TestIngestQueue:
+    @pytest.mark.asyncio
+    async def test_run(self, file):
+        path = spool_upload(io.BytesIO(b"a,b\n" + b"".join(b"%d,x%d\n" % (i, i) for i in range(50))))
+        job = IngestJob(file.id, path)
+        queue = IngestQueue(workers=1)
+        await queue.run(job)
+        assert job.status == "ready"
+        assert job.rows_ingested == 50
+        assert job.bytes_processed == job.total_bytes
+        assert not os.path.exists(path)
+        async with db_service() as service:
+            assert (await service.get_file(file.id)).status == "ready"
+            data = await service.get_data(file.id, {"a": ">=48"})
+            assert [item.value for item in data] == ["48", "x48", "49", "x49"]
+
+    @pytest.mark.asyncio
+    async def test_run_parallel(self, file):
+        rows = b"".join(b'%d,"x\n%d"\n' % (i, i) for i in range(500))
+        path = spool_upload(io.BytesIO(b"a,b\n" + rows))
+        job = IngestJob(file.id, path)
+        queue = IngestQueue(workers=1, parse_workers=2, chunk_bytes=256)
+        try:
+            await queue.run(job)
+        finally:
+            await queue.stop()
+        assert job.status == "ready"
+        assert job.rows_ingested == 500
+        assert job.bytes_processed == job.total_bytes
+        async with db_service() as service:
+            rows = [row async for row in service.stream_data(file.id)]
+            assert rows == [[str(i), f"x\n{i}"] for i in range(500)]
+
+    @pytest.mark.asyncio
+    async def test_run_failed(self, file):
+        path = spool_upload(io.BytesIO(b"a,b\n1,x\n"))
+        job = IngestJob(uuid4(), path)
+        await IngestQueue(workers=1).run(job)
+        assert job.status == "failed"
+        assert job.error
+
+    @pytest.mark.asyncio
+    async def test_run_failed_status_update(self, file, monkeypatch):
+        def unavailable():
+            raise ConnectionError("database unavailable")
+
+        path = spool_upload(io.BytesIO(b"a,b\n1,x\n"))
+        job = IngestJob(file.id, path)
+        monkeypatch.setattr("src.ingest.jobs.async_session", unavailable)
+        await IngestQueue(workers=1).run(job)
+        assert job.status == "failed"
+        assert not os.path.exists(path)
+
+    @pytest.mark.asyncio
+    async def test_run_lease_lost(self, file):
+        path = spool_upload(io.BytesIO(b"a,b\n1,x\n"))
+        job = IngestJob(file.id, path)
+        await IngestQueue(workers=1, owner="other").run(job)
+        assert job.status == "failed"
+        async with db_service() as service:
+            assert (await service.get_file(file.id)).status == "processing"
+            assert await service.get_data(file.id, {}) == []
+
+    @pytest.mark.asyncio
+    async def test_recover(self, file):
+        async with db_service() as service:
+            expired = await service.create_file(
+                "expired.csv", file.owner_id, ["a"], ["int"], status="processing"
+            )
+            await service.commit()
+        old = time.time() - 3600
+        live_spool = spool_upload(io.BytesIO(b"a,b\n1,x\n"), INGEST_OWNER)
+        dead_spool = spool_upload(io.BytesIO(b"a,b\n1,x\n"), "dead")
+        new_spool = spool_upload(io.BytesIO(b"a,b\n1,x\n"), "dead")
+        os.utime(live_spool, (old, old))
+        os.utime(dead_spool, (old, old))
+        try:
+            file_ids = await IngestQueue(workers=1, owner="recovering").recover()
+            assert expired.id in file_ids
+            assert file.id not in file_ids
+            assert os.path.exists(live_spool)
+            assert not os.path.exists(dead_spool)
+            assert os.path.exists(new_spool)
+            async with db_service() as service:
+                assert (await service.get_file(expired.id)).status == "failed"
+                assert (await service.get_file(file.id)).status == "processing"
+        finally:
+            os.remove(live_spool)
+            os.remove(new_spool)
+            async with db_service() as service:
+                await service.delete_file(expired.id)
+                await service.commit()
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, MetaData, Table, create_mock_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from src.database.partitions import partition_by_hash, partition_names
+
+
+def test_partition_by_hash():
+    table = Table(
+        "cells",
+        MetaData(),
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("file_id", Integer, primary_key=True),
+    )
+    partition_by_hash(table, "file_id", 2)
+    assert "PARTITION BY HASH (file_id)" in str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    statements = []
+    engine = create_mock_engine(
+        "postgresql://", lambda sql, *args, **kwargs: statements.append(str(sql.compile(dialect=engine.dialect)))
+    )
+    table.metadata.create_all(engine, checkfirst=False)
+    assert statements[1:] == [
+        "CREATE TABLE cells_p0 PARTITION OF cells FOR VALUES WITH (MODULUS 2, REMAINDER 0)",
+        "CREATE TABLE cells_p1 PARTITION OF cells FOR VALUES WITH (MODULUS 2, REMAINDER 1)",
+    ]
+    assert partition_names("cells", 2) == ["cells_p0", "cells_p1"]
+
+
+def test_no_partitions():
+    table = Table("cells", MetaData(), Column("id", Integer, primary_key=True))
+    partition_by_hash(table, "id", 0)
+    assert "PARTITION BY" not in str(CreateTable(table).compile(dialect=postgresql.dialect()))
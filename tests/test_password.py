@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+from src.auth.password import get_password_hash_async, verify_password_async
+
+
+class TestPassword:
+    @pytest.mark.asyncio
+    async def test_hash_and_verify(self):
+        hashed = await get_password_hash_async("password")
+        assert hashed != "password"
+        assert await verify_password_async("password", hashed) is True
+        assert await verify_password_async("wrong", hashed) is False
+
+    @pytest.mark.asyncio
+    async def test_concurrent_hashes(self):
+        hashes = await asyncio.gather(*(get_password_hash_async(str(i)) for i in range(4)))
+        results = await asyncio.gather(
+            *(verify_password_async(str(i), hashed) for i, hashed in enumerate(hashes))
+        )
+        assert results == [True] * 4
@@ -0,0 +1,9 @@
+from src.database import DB_MAX_OVERFLOW, DB_POOL_SIZE, pool_status
+
+
+def test_pool_status():
+    status = pool_status()
+    assert status["size"] == DB_POOL_SIZE
+    assert status["max_overflow"] == DB_MAX_OVERFLOW
+    assert status["checked_out"] >= 0
+    assert set(status) >= {"connects", "checkouts", "invalidations"}